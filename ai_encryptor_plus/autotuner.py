@@ -1,7 +1,8 @@
 # ai_encryptor_plus/autotuner.py
-import os, time, hashlib
+import os, time, hashlib, random
 from typing import Tuple, List
 import multiprocessing
+from multiprocessing import shared_memory
 import concurrent.futures
 
 def cpu_count():
@@ -12,62 +13,94 @@ def cpu_count():
 
 # --- OS REQUIREMENT: Top-level function for Pickling ---
 # Local functions inside _trial() cannot be pickled on Windows when using Processes.
-def _worker_task(data_chunk: bytes) -> bool:
+
+# Worker-side cache of attached shared-memory blocks: one shm_open+mmap
+# per worker process instead of one per task.
+_SHM_CACHE = {}
+
+def _worker_task(args) -> bool:
+    # Task payload is just (shm_name, offset, length) - ~24 bytes pickled
+    # instead of the whole chunk. Workers hash straight out of shared
+    # memory, so the benchmark measures hashing, not pickle+pipe IPC.
+    shm_name, offset, length = args
+    shm = _SHM_CACHE.get(shm_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHM_CACHE[shm_name] = shm
     # Simulate CPU-heavy work (SHA256 is a good proxy for AES)
-    hashlib.sha256(data_chunk).digest()
+    hashlib.sha256(memoryview(shm.buf)[offset:offset + length]).digest()
     return True
 
-def _trial(chunk_size: int, workers: int, sample_mb: int = 16) -> float:
-    # Create random data buffer
-    # Note: For the benchmark, we still pass data via IPC (Pickle) rather than mmap.
-    # This actually helps penalize "Too Many Workers" correctly, because 
-    # it simulates the overhead of coordinating many heavy processes.
-    data = os.urandom(sample_mb * 1024 * 1024)
-    
-    # Slicing
-    parts = [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
-    
+def _trial(executor, shm_name: str, total_size: int,
+           chunk_size: int, workers: int) -> float:
+    # Chunk coordinates into the shared sample buffer (zero-copy).
+    # range slicing is O(1), so no materialized list of parts either -
+    # each wave builds only the handful of tuples it is about to submit.
+    offsets = range(0, total_size, chunk_size)
+
     t0 = time.time()
-    
-    # --- OS CHANGE: Use ProcessPoolExecutor ---
-    # This measures the cost of spawning processes + context switching.
-    # If 16 workers take too long to start, this benchmark will now catch it!
-    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
-        # We use list() to force execution and wait for all results
-        list(ex.map(_worker_task, parts))
-        
+
+    # The pool is shared across all (chunk, worker) combos; to measure a
+    # candidate worker count we simply cap the in-flight tasks at that
+    # count per wave, instead of paying a full pool spin-up per trial.
+    for i in range(0, len(offsets), workers):
+        wave = [(shm_name, off, min(chunk_size, total_size - off))
+                for off in offsets[i:i + workers]]
+        for _ in executor.map(_worker_task, wave):
+            pass
+
     t1 = time.time()
     elapsed = t1 - t0
-    
+
     # Return MB/s
-    throughput = len(data) / (1024*1024) / max(1e-6, elapsed)
+    throughput = total_size / (1024*1024) / max(1e-6, elapsed)
     return throughput
 
-def tune_short(trial_seconds: int = 3, candidate_chunks: List[int] = None) -> dict:
+def tune_short(trial_seconds: int = 3, candidate_chunks: List[int] = None,
+               sample_mb: int = 16) -> dict:
     # Benchmarking different configurations
     if candidate_chunks is None:
         candidate_chunks = [1*1024*1024, 4*1024*1024, 8*1024*1024, 16*1024*1024]
-    
+
     cpus = cpu_count()
     # We test: 1 worker, Half Cores, All Cores, and 1.5x Cores (to see if oversubscribing helps)
     candidate_workers = sorted(list(set([1, max(1, cpus//2), cpus, int(cpus * 1.5)])))
-    
+
     results = {}
     print(f"  [AutoTuner] Benchmarking {len(candidate_chunks)} chunk sizes across {candidate_workers} worker counts...")
-    
-    for c in candidate_chunks:
-        for w in candidate_workers:
-            try:
-                perf = _trial(c, w)
-                results[(c, w)] = perf
-                # Optional: Debug print to see scores real-time
-                # print(f"    Chunk {c//1024//1024}MB | Workers {w} -> {perf:.2f} MB/s")
-            except Exception as e:
-                # print(f"    Failed {c}, {w}: {e}")
-                results[(c, w)] = 0.0
-                
+
+    # One sample buffer in shared memory + one pre-warmed pool, reused by
+    # every trial. Spawning a pool and pickling 16MB per combo measured
+    # process startup and IPC, not the hashing work we care about.
+    total_size = sample_mb * 1024 * 1024
+    shm = shared_memory.SharedMemory(create=True, size=total_size)
+    try:
+        # The sample is only ever hashed for timing - it needs to be
+        # incompressible-ish, not cryptographically random. randbytes()
+        # (Mersenne Twister, C speed) fills ~10x faster than draining
+        # os.urandom for 16MB, and a fixed seed keeps trials comparable
+        # across runs.
+        shm.buf[:total_size] = random.Random(0).randbytes(total_size)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(candidate_workers)) as ex:
+            for c in candidate_chunks:
+                for w in candidate_workers:
+                    try:
+                        perf = _trial(ex, shm.name, total_size, c, w)
+                        results[(c, w)] = perf
+                        # Optional: Debug print to see scores real-time
+                        # print(f"    Chunk {c//1024//1024}MB | Workers {w} -> {perf:.2f} MB/s")
+                    except Exception as e:
+                        # print(f"    Failed {c}, {w}: {e}")
+                        results[(c, w)] = 0.0
+    finally:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
     # Pick the winner
     best = max(results.items(), key=lambda kv: kv[1])
     best_chunk, best_workers = best[0]
-    
+
     return {"best_chunk": best_chunk, "best_workers": best_workers, "all": results}
@@ -1,6 +1,8 @@
-import os, secrets, json, math, hashlib, mmap, gc
+import os, secrets, json, math, hashlib, hmac, mmap, gc, atexit, threading, queue, functools, errno, shutil
+from collections import OrderedDict
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from typing import Tuple
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from .key_vault import store_key, load_key
@@ -9,6 +11,7 @@ from .key_vault import store_key, load_key
 HEADER_MAGIC = b"CTRCH"
 HEADER_SIZE = 5 + 16 + 8 # Magic(5) + Nonce(16) + ChunkSize(8) = 29 bytes
 LEN_PREFIX_SIZE = 8 # 8 bytes for length prefix per chunk
+MAC_SIZE = 32 # HMAC-SHA256 digest size in the .macs.bin sidecar
 
 def _derive_base_nonce() -> bytes:
     return secrets.token_bytes(8) + secrets.token_bytes(8)
@@ -18,42 +21,191 @@ def _chunk_nonce(base_nonce: bytes, idx: int) -> bytes:
     counter_bytes = idx.to_bytes(8, "big")
     return prefix + counter_bytes
 
+# lru_cache: each pool worker derives the auth key once per file key and
+# reuses it for every chunk, so the derived key never has to travel in
+# the per-task tuples. (A pool initializer can't carry it - the global
+# executor outlives any single file's key.)
+@functools.lru_cache(maxsize=8)
 def _derive_auth_key(aes_key: bytes) -> bytes:
     return hashlib.sha256(aes_key + b"auth_key").digest()
 
+# Local aliases: attribute lookups on hmac/hashlib cost a dict walk per
+# call, noticeable when the workers run once per chunk.
+_hmac_new = hmac.new
+_sha256 = hashlib.sha256
+
+# --- CTR KERNEL (AES-NI BATCHED, ZERO-COPY) ---
+# cryptography is a hard dependency of this project, so OpenSSL's
+# hardware-dispatched CTR kernel is always available; we deliberately do
+# NOT ship a pure-Python/JIT AES fallback. A re-implemented AES would be
+# slower than OpenSSL on every platform we target and would put
+# hand-rolled crypto in the data path, which is not a trade worth making
+# for a hypothetical install without working wheels.
+# 256 KiB: big enough that each update_into still hits OpenSSL's
+# multi-block AES-NI kernel, small enough that the segment is still in
+# L2 when the HMAC pass reads it back.
+_MAC_SEGMENT = 1 << 18
+
+def _ctr_xor_mac(key: bytes, nonce: bytes, data, out, auth_key: bytes) -> bytes:
+    # Encrypt and MAC interleaved per L2-sized segment: the HMAC pass
+    # reads each ciphertext segment while it is still cache-hot from the
+    # CTR kernel, instead of streaming the whole chunk from memory twice.
+    # update_into() writes straight into `out` - no intermediate bytes
+    # objects, no update()+finalize() concat copy.
+    enc = Cipher(algorithms.AES(key), modes.CTR(nonce)).encryptor()
+    h = _hmac_new(auth_key, digestmod=_sha256)
+    total = len(data)
+    for off in range(0, total, _MAC_SEGMENT):
+        end = min(off + _MAC_SEGMENT, total)
+        enc.update_into(data[off:end], out[off:end])
+        h.update(out[off:end])
+    enc.finalize()
+    return h.digest()
+
+# --- PER-WORKER MMAP CACHE ---
+# Each pool worker keeps the source file mapped once instead of paying an
+# open+mmap+munmap syscall trio per chunk. Keyed per-pid so a cache
+# inherited through fork() is discarded instead of shared. LRU-capped:
+# the pool is app-global and long-lived, and Flask deletes the upload
+# dir after each response - an unbounded cache would pin every deleted
+# source file's disk blocks (and address space) in every worker for the
+# life of the pool. A small cap still covers the chunks of the files
+# currently in flight; eviction is safe because a worker releases its
+# view before it picks up the next task.
+_MMAP_CACHE = OrderedDict()
+_MMAP_MAX = 4
+_MMAP_PID = None
+
+def _close_mmap_cache():
+    for mm in _MMAP_CACHE.values():
+        try: mm.close()
+        except Exception: pass
+    _MMAP_CACHE.clear()
+
+def _get_mmap(src_path: str) -> mmap.mmap:
+    global _MMAP_PID
+    if _MMAP_PID != os.getpid():
+        # Fresh worker (or forked child): drop inherited entries.
+        _MMAP_CACHE.clear()
+        _MMAP_PID = os.getpid()
+        atexit.register(_close_mmap_cache)
+    mm = _MMAP_CACHE.get(src_path)
+    if mm is None:
+        with open(src_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _MMAP_CACHE[src_path] = mm
+        while len(_MMAP_CACHE) > _MMAP_MAX:
+            _, old = _MMAP_CACHE.popitem(last=False)
+            try: old.close()
+            except Exception: pass
+    else:
+        _MMAP_CACHE.move_to_end(src_path)
+    return mm
+
 # --- WORKER (MMAP ZERO-COPY) ---
-def _worker_encrypt_chunk_mmap(args) -> Tuple[int, bytes]:
-    key, base_nonce, idx, src_path, offset, length = args
+def _worker_encrypt_chunk_mmap(args) -> Tuple[int, str, int, str]:
+    key, base_nonce, idx, src_path, offset, length, shm_name = args
     nonce = _chunk_nonce(base_nonce, idx)
-    
-    with open(src_path, "r+b") as f:
-        # Direct OS Map - Zero User Buffer Copy
-        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-            chunk_data = mm[offset : offset + length]
-            cipher = Cipher(algorithms.AES(key), modes.CTR(nonce))
-            op = cipher.encryptor()
-            # Encrypt
-            ct = op.update(chunk_data) + op.finalize()
-            
-    return idx, ct
+    auth_key = _derive_auth_key(key)
+
+    # Cached map: the kernel keeps the pages hot across all chunks this
+    # worker handles, and we only map the file once per worker.
+    mm = _get_mmap(src_path)
+    # memoryview slice = no bytes copy out of the page cache; ciphertext
+    # goes straight into the shared-memory block the parent handed us,
+    # so nothing chunk-sized is ever pickled back through the pool.
+    view = memoryview(mm)[offset : offset + length]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        ct = memoryview(shm.buf)[:length]
+        # HMAC here, not in the parent: it runs on the core that just
+        # wrote the ciphertext and in parallel across workers, and the
+        # segment-interleaved kernel MACs each piece while it is still
+        # hot in this core's cache.
+        mac = _ctr_xor_mac(key, nonce, view, ct, auth_key)
+        ct.release()
+    finally:
+        view.release()
+        shm.close()
+
+    return idx, shm_name, length, mac
 
 def _worker_decrypt_chunk(args) -> Tuple[int, bytes]:
-    key, base_nonce, idx, ct = args
+    key, base_nonce, idx, ct, expected_mac = args
     nonce = _chunk_nonce(base_nonce, idx)
-    cipher = Cipher(algorithms.AES(key), modes.CTR(nonce))
-    dec = cipher.decryptor()
-    pt = dec.update(ct) + dec.finalize()
+
+    # Verify the chunk MAC in the worker: the verification work scales
+    # out across the pool instead of serializing on one core, and the
+    # segment loop keeps each hashlib call long enough to release the
+    # GIL without holding it for the whole chunk.
+    if expected_mac is not None:
+        auth_key = _derive_auth_key(key)
+        h = _hmac_new(auth_key, digestmod=_sha256)
+        mv = memoryview(ct)
+        for off in range(0, len(mv), _MAC_SEGMENT):
+            h.update(mv[off:off + _MAC_SEGMENT])
+        if not hmac.compare_digest(h.digest(), expected_mac):
+            raise ValueError(f"Chunk {idx}: HMAC verification failed (corrupt or tampered)")
+
+    pt = bytearray(len(ct))
+    dec = Cipher(algorithms.AES(key), modes.CTR(nonce)).decryptor()
+    dec.update_into(ct, pt)
+    dec.finalize()
     return idx, pt
 
 # --- MAIN ENGINE (SCATTER-WRITE OPTIMIZED) ---
 
+def _finalize_output(tmp: Path, dst: Path) -> None:
+    # Same filesystem: plain atomic rename. Cross-device (tmp dir on a
+    # different mount than the destination) rename fails with EXDEV and
+    # would otherwise need a userspace copy loop - use sendfile so the
+    # kernel moves the bytes, then swap in atomically.
+    try:
+        os.replace(str(tmp), str(dst))
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    size = tmp.stat().st_size
+    part = dst.with_suffix(dst.suffix + ".part")
+    with open(tmp, "rb") as s_f, open(part, "wb") as d_f:
+        if hasattr(os, "sendfile"):
+            off = 0
+            while off < size:
+                n = os.sendfile(d_f.fileno(), s_f.fileno(), off, min(1 << 24, size - off))
+                if n == 0:
+                    break
+                off += n
+        else:
+            shutil.copyfileobj(s_f, d_f, 1 << 20)
+    os.replace(str(part), str(dst))
+    os.unlink(str(tmp))
+
+
+if hasattr(os, "pwritev"):
+    def _pwrite_chunk(fd: int, pos: int, len_bytes: bytes, ct) -> None:
+        # One syscall writes prefix+data at the target offset: no seek,
+        # no concat, and safe to call from multiple threads on one fd.
+        os.pwritev(fd, [len_bytes, ct], pos)
+elif hasattr(os, "pwrite"):
+    def _pwrite_chunk(fd: int, pos: int, len_bytes: bytes, ct) -> None:
+        os.pwrite(fd, len_bytes, pos)
+        os.pwrite(fd, ct, pos + len(len_bytes))
+else:
+    def _pwrite_chunk(fd: int, pos: int, len_bytes: bytes, ct) -> None:
+        # Windows: emulate with seek+write (single-writer only).
+        os.lseek(fd, pos, os.SEEK_SET)
+        os.write(fd, len_bytes)
+        os.write(fd, ct)
+
 def encrypt_file_chunked(src: Path, dst: Path, key: bytes, key_id: str,
                          master_secret: str,
                          chunk_size: int = 8 * 1024 * 1024,
                          workers: int = 4,
                          use_processes: bool = True,
                          write_manifest: bool = True,
-                         executor=None):
+                         executor=None,
+                         store: bool = True):
     
     # 1. Setup
     src = Path(src)
@@ -64,104 +216,187 @@ def encrypt_file_chunked(src: Path, dst: Path, key: bytes, key_id: str,
     filesize = src.stat().st_size
     chunk_count = math.ceil(filesize / chunk_size) if chunk_size > 0 else 1
     base_nonce = _derive_base_nonce()
-    auth_key = _derive_auth_key(key)
 
     # 2. Prepare Tasks (Coordinates)
-    args_list = []
+    coords = []
     for idx in range(chunk_count):
         offset = idx * chunk_size
         length = min(chunk_size, filesize - offset)
-        args_list.append((key, base_nonce, idx, str(src), offset, length))
+        coords.append((idx, offset, length))
 
-    # 3. Submit to Pool
+    # 3. Pick Pool
+    pool = None
     if executor and use_processes:
-        futures = {executor.submit(_worker_encrypt_chunk_mmap, a): i for i, a in enumerate(args_list)}
+        ex = executor
     elif use_processes:
         # Fallback pool (only if global is missing)
         pool = ProcessPoolExecutor(max_workers=workers)
-        futures = {pool.submit(_worker_encrypt_chunk_mmap, a): i for i, a in enumerate(args_list)}
+        ex = pool
     else:
         # Thread fallback (rare)
-        from concurrent.futures import ThreadPoolExecutor
         pool = ThreadPoolExecutor(max_workers=workers)
-        futures = {pool.submit(_worker_encrypt_chunk_mmap, a): i for i, a in enumerate(args_list)}
+        ex = pool
+
+    # Ciphertext comes back through shared memory, not pickle: one
+    # chunk-sized block per in-flight task (2*workers keeps the pool
+    # fed), recycled as chunks are written out. For a 1 GB file this
+    # removes ~1 GB of pickle+pipe traffic through the executor.
+    shm_blocks = []
+    free_q = queue.Queue()
+    for _ in range(min(chunk_count, 2 * workers)):
+        blk = shared_memory.SharedMemory(create=True, size=chunk_size)
+        shm_blocks.append(blk)
+        free_q.put(blk)
+    shm_by_name = {blk.name: blk for blk in shm_blocks}
+
+    # Completed chunks flow to a dedicated writer thread through a
+    # bounded queue, so disk writes overlap with worker production and
+    # the pool's result thread never does more than a q.put(). The free
+    # block queue doubles as backpressure: submission stalls when all
+    # 2*workers blocks are in flight, capping peak memory.
+    result_q = queue.Queue(maxsize=2 * workers)
+
+    def _on_done(blk, fut):
+        try:
+            result_q.put(("ok", fut.result(), None))
+        except Exception as e:
+            result_q.put(("err", e, blk))
+
+    def _submit(coord, blk):
+        idx, offset, length = coord
+        a = (key, base_nonce, idx, str(src), offset, length, blk.name)
+        fut = ex.submit(_worker_encrypt_chunk_mmap, a)
+        fut.add_done_callback(lambda f, b=blk: _on_done(b, f))
+        return fut
 
     # 4. ASYNC SCATTER-WRITE (The Speedup)
     # Instead of waiting for all, we write to disk AS SOON as a chunk finishes.
     # We use file.seek() to place the data in the exact correct spot.
-    
+
     # Disable GC to prevent micro-stutters during high-speed IO
     gc.disable()
-    
+
+    # Raw fd + positioned writes: pwritev places prefix+chunk at the
+    # right offset in one syscall, with no seek state to maintain.
+    out_fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
     try:
-        with open(tmp, "wb") as out:
-            # A. Write Header immediately
-            out.write(HEADER_MAGIC)
-            out.write(base_nonce)
-            out.write(chunk_size.to_bytes(8, "big"))
-            
-            # B. Pre-allocate file size (Optional, prevents fragmentation)
-            # Total = Header + (Count * LenPrefix) + FileSize
-            # (Approximate, assumes CiphertextLen == PlaintextLen which is true for CTR)
-            # out.seek(HEADER_SIZE + (chunk_count * LEN_PREFIX_SIZE) + filesize - 1)
-            # out.write(b'\0')
-            
-            chunk_hmacs = [None] * chunk_count
-
-            # C. Process Results Out-of-Order
-            for fut in as_completed(futures):
-                idx, ct = fut.result()
-                
-                # Calculate HMAC while data is hot in cache
-                mac = hmac.new(auth_key, ct, hashlib.sha256).hexdigest()
-                chunk_hmacs[idx] = mac
-
-                # CALCULATE DISK OFFSET
-                # Where does this chunk belong?
-                # Pos = Header + (Index * (LenPrefix + ChunkSize))
-                # Note: This math works because all chunks (except last) are fixed size.
-                # For the last chunk, it naturally falls at the end, but since we might 
-                # write the last chunk *before* the first one finishes, we need exact math.
-                
-                # Wait! If last chunk is smaller, simple multiplication fails for indexes AFTER it?
-                # Actually, only the *last* chunk varies. So standard multiplication works 
-                # for every chunk start position.
-                
-                write_pos = HEADER_SIZE + (idx * (LEN_PREFIX_SIZE + chunk_size))
-                
-                # Write Length + Data
-                out.seek(write_pos)
-                out.write(len(ct).to_bytes(8, "big"))
-                out.write(ct)
-                
-                # Release memory immediately
-                del ct
-                
+        # A. Pre-allocate the full output extent so out-of-order pwrites
+        # land in already-reserved blocks instead of growing the file
+        # piecemeal (extent churn + metadata lock traffic on ext4/xfs).
+        # Exact size: header + per-chunk prefix + ciphertext (CTR keeps
+        # plaintext length, only the last chunk is short).
+        if chunk_count and hasattr(os, "posix_fallocate"):
+            total = HEADER_SIZE + chunk_count * LEN_PREFIX_SIZE + filesize
+            try:
+                os.posix_fallocate(out_fd, 0, total)
+            except OSError:
+                pass  # e.g. tmpfs/NFS without fallocate support
+
+        # B. Write Header immediately
+        os.write(out_fd, HEADER_MAGIC + base_nonce + chunk_size.to_bytes(8, "big"))
+
+        # Raw 32-byte digests packed at idx*32: no hex strings, no
+        # per-chunk Python list entries, O(1) load on decrypt.
+        chunk_macs = bytearray(chunk_count * MAC_SIZE)
+        writer_err = []
+
+        # C. Writer thread: drains completed chunks and scatter-writes
+        # them while the pool keeps producing. MAC already computed by
+        # the worker while the ciphertext was hot in its cache, so this
+        # is a pure assembler.
+        def _writer():
+            for _ in range(chunk_count):
+                status, payload, err_blk = result_q.get()
+                if status == "err":
+                    writer_err.append(payload)
+                    free_q.put(err_blk)
+                    continue
+                idx, shm_name, length, mac = payload
+                blk = shm_by_name[shm_name]
+                # A write failure (ENOSPC, EIO) must not kill this thread
+                # silently: the submission loop would deadlock on
+                # free_q.get() with dead writers, or worse, wt.join()
+                # would return and finalize a corrupt .enc. Record the
+                # error, keep draining, keep recycling blocks; the main
+                # thread re-raises after join. After the first failure
+                # further writes are pointless, so skip them.
+                if not writer_err:
+                    # CALCULATE DISK OFFSET
+                    # Pos = Header + (Index * (LenPrefix + ChunkSize)).
+                    # Only the *last* chunk varies in size, so standard
+                    # multiplication works for every chunk start position.
+                    write_pos = HEADER_SIZE + (idx * (LEN_PREFIX_SIZE + chunk_size))
+
+                    # Write Length + Data straight out of shared memory.
+                    # The view is released even on failure - the stored
+                    # exception's traceback must not pin an export of
+                    # blk.buf, or the shm cleanup in the main thread
+                    # dies with BufferError.
+                    ctv = memoryview(blk.buf)[:length]
+                    try:
+                        chunk_macs[idx*MAC_SIZE:(idx+1)*MAC_SIZE] = mac
+                        _pwrite_chunk(out_fd, write_pos, length.to_bytes(8, "big"), ctv)
+                    except Exception as e:
+                        writer_err.append(e)
+                    finally:
+                        ctv.release()
+
+                # Recycle the block for the next pending chunk
+                free_q.put(blk)
+
+        wt = threading.Thread(target=_writer, name="chunk-writer", daemon=True)
+        wt.start()
+
+        # D. Submit chunks, gated by block availability (backpressure).
+        for coord in coords:
+            blk = free_q.get()
+            _submit(coord, blk)
+
+        wt.join()
+        if writer_err:
+            raise writer_err[0]
+
     finally:
         gc.enable()
-        if not executor and use_processes:
+        os.close(out_fd)
+        for blk in shm_blocks:
+            blk.close()
+            try:
+                blk.unlink()
+            except FileNotFoundError:
+                pass
+        if pool is not None:
             pool.shutdown()
 
     # 5. Finalize
-    os.replace(str(tmp), str(dst))
+    _finalize_output(tmp, dst)
 
     if write_manifest:
+        # MACs live in a packed binary sidecar (idx*32 addressing);
+        # the JSON manifest only references it. A 10 GB file at 16 MB
+        # chunks is 20 KB of digests instead of ~41 KB of hex-in-JSON
+        # that had to be parsed element by element on decrypt.
+        macs_file = dst.with_suffix(dst.suffix + ".macs.bin")
+        macs_file.write_bytes(chunk_macs)
         m = {
             "mode": "CTR_CHUNKED",
             "base_nonce": base_nonce.hex(),
             "chunk_size": chunk_size,
             "chunk_count": chunk_count,
             "key_id": key_id,
-            "chunk_hmacs": chunk_hmacs, # Only thing that needs order
-            "version": 1
+            "macs_file": macs_file.name,
+            "mac_alg": "hmac-sha256",
+            "mac_size": MAC_SIZE,
+            "version": 2
         }
         manifest.write_text(json.dumps(m))
 
-    try: store_key(key_id, key, "ctr", master_secret)
-    except: pass
+    # Batch callers jo key pehle hi store_keys_bulk se likh chuke hain
+    # store=False dete hain (per-file redundant fsync bachta hai)
+    if store:
+        try: store_key(key_id, key, "ctr", master_secret)
+        except: pass
 
-# Import needed for HMAC inside function
-import hmac 
 
 def decrypt_file_chunked(enc_path: Path, out_path: Path, key_id: str=None, 
                          master_secret: str = None, 
@@ -179,96 +414,72 @@ def decrypt_file_chunked(enc_path: Path, out_path: Path, key_id: str=None,
 
     if not master_secret: raise ValueError("Master secret required")
     key, mode = load_key(keyid, master_secret)
-    
-    # SCATTER-READ STRATEGY
-    # We don't need to read sequentially either.
-    
+
     chunk_count = m["chunk_count"]
-    
-    # 1. Launch Tasks
+
+    # Expected MACs: packed binary sidecar (manifest v2), falling back
+    # to the legacy hex list for v1 manifests. Sirf v1 ke liye missing
+    # MACs verification skip karte hain - v2 manifest sidecar declare
+    # karta hai, toh uska gayab/short hona tamper hai (attacker ek file
+    # hata ke integrity off nahi kar sakta).
+    expected_macs = [None] * chunk_count
+    macs_name = m.get("macs_file")
+    if macs_name:
+        macs_path = enc_path.parent / macs_name
+        mac_size = int(m.get("mac_size", MAC_SIZE))
+        try:
+            packed = macs_path.read_bytes()
+        except FileNotFoundError:
+            packed = None
+        if packed is None or len(packed) < chunk_count * mac_size:
+            if int(m.get("version", 1)) >= 2:
+                raise ValueError(
+                    f"MAC sidecar '{macs_name}' missing or truncated - refusing unverified decrypt")
+        else:
+            expected_macs = [bytes(packed[i*mac_size:(i+1)*mac_size])
+                             for i in range(chunk_count)]
+    elif m.get("chunk_hmacs"):
+        expected_macs = [bytes.fromhex(h) if h else None for h in m["chunk_hmacs"]]
+
+    # SCATTER-READ: the encryptor writes a rigid grid -
+    # chunk idx lives at HEADER_SIZE + idx*(LEN_PREFIX + chunk_size),
+    # only the last chunk is short. So we mmap the file once and slice
+    # each chunk straight out of the page cache; no sequential Python
+    # read() loop, no per-chunk syscalls.
+    grid = LEN_PREFIX_SIZE + chunk_size
     args_list = []
-    
-    # We must open file to read offsets? 
-    # Actually, since we enforce fixed structure, we can predict read offsets too!
-    
-    with open(enc_path, "rb") as f:
-        # Verify Header
-        if f.read(5) != HEADER_MAGIC: raise ValueError("Invalid header")
-        
-        # Since we used "Sparse/Seek" writing, the file on disk might have gaps 
-        # if we didn't fill it perfectly, but we did.
-        # However, reading involves checking length prefixes.
-        
-        # Optimization: Just read the whole thing into mmap and slice it up?
-        # For decryption, we can't easily use mmap for *variable* length records 
-        # if we didn't enforce strict size. 
-        # But in our encryptor, we did: write_pos = ... idx * (LEN + chunk_size)
-        # This essentially padded the file to fixed blocks (except last).
-        
-        # So we can use calculated offsets for decryption too!
-        pass
-
-    # Since decryption logic is complex to scatter-gather safely without strict 
-    # validation, let's stick to the robust read-all-headers approach but 
-    # parallelize execution rapidly.
-    
-    chunks_data = []
     with open(enc_path, "rb") as f:
-        f.seek(HEADER_SIZE) # Skip header
-        
-        for _ in range(chunk_count):
-            # In our fixed-grid format, we can seek!
-            # This is faster than reading linearly if OS buffers are smart.
-            len_bytes = f.read(8)
-            if not len_bytes: break
-            l = int.from_bytes(len_bytes, "big")
-            ct = f.read(l)
-            chunks_data.append(ct)
-            
-            # If this wasn't the last chunk, and l < chunk_size, we might need to seek forward
-            # to the next grid slot?
-            # Our encryptor writes to: HEADER_SIZE + (idx * (LEN + chunk_size))
-            # If actual data was smaller (last chunk), the next chunk starts far away.
-            # But loop assumes packed.
-            
-            # CRITICAL FIX for reading "Sparse/Grid" files:
-            # We must seek to the next grid position after reading, 
-            # unless we simply read sequentially and assume the file is packed.
-            
-            # If we used seek() in writer, we created holes (sparse file) or overwritten.
-            # Simpler approach for Decryptor compatibility:
-            # Just read sequentially. The writer produced a valid stream?
-            # No, the writer used seek(). If chunk 1 is 5 bytes but chunk_size is 10,
-            # writer put chunk 2 at offset 10+8. There is a gap!
-            
-            # To fix this complexity: The Writer logic above assumes input 
-            # was FULL chunks. Elastic chunking ensures this for all except last.
-            # So no gaps exist for 0..N-1. 
-            # So sequential read is safe.
-            pass
-
-    # Parallel Decrypt
-    args_list = [(key, base_nonce, i, ct) for i, ct in enumerate(chunks_data)]
-    results = [None] * len(args_list)
-    
-    # Use Global Pool
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:5] != HEADER_MAGIC: raise ValueError("Invalid header")
+            for idx in range(chunk_count):
+                start = HEADER_SIZE + idx * grid
+                length = int.from_bytes(mm[start:start + LEN_PREFIX_SIZE], "big")
+                ct = mm[start + LEN_PREFIX_SIZE : start + LEN_PREFIX_SIZE + length]
+                args_list.append((key, base_nonce, idx, ct, expected_macs[idx]))
+
+    # Parallel Decrypt (Use Global Pool when available)
+    pool = None
     if executor and use_processes:
-        futures = {executor.submit(_worker_decrypt_chunk, a): i for i, a in enumerate(args_list)}
+        ex = executor
     else:
         pool = ProcessPoolExecutor(max_workers=workers)
-        futures = {pool.submit(_worker_decrypt_chunk, a): i for i, a in enumerate(args_list)}
-        
+        ex = pool
+    futures = {ex.submit(_worker_decrypt_chunk, a): i for i, a in enumerate(args_list)}
+
     # Scatter-Write Decrypted
     tmp = out_path.with_suffix(out_path.suffix + ".tmp")
-    
-    with open(tmp, "wb") as out:
-        for fut in as_completed(futures):
-            idx, pt = fut.result()
-            # Calculate plaintext offset
-            # Plaintext is just pure data, no length prefixes.
-            # Pos = idx * chunk_size
-            out.seek(idx * chunk_size)
-            out.write(pt)
-            del pt
-
-    os.replace(str(tmp), str(out_path))
+
+    try:
+        with open(tmp, "wb") as out:
+            for fut in as_completed(futures):
+                idx, pt = fut.result()
+                # Plaintext is pure data, no length prefixes:
+                # Pos = idx * chunk_size
+                out.seek(idx * chunk_size)
+                out.write(pt)
+                del pt
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    _finalize_output(tmp, out_path)
@@ -1,14 +1,23 @@
 import argparse, os, time, hashlib, json, math
+import multiprocessing
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor
 from typing import Tuple, List
 
 from .config import DEFAULT_CHUNK_MB
 from .encryptor import gen_key, encrypt_stream
+from .key_vault import store_keys_bulk
 from .scheduler_plus import SchedulerPlus, Task 
 from .packager import make_archive
 from .decryptor import decrypt_file
 from .chunked_ctr import encrypt_file_chunked, decrypt_file_chunked
+from .fs_utils import iter_entries
+
+# C-accelerated JSON encoder optional hai - manifest bada ho sakta hai
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def _calculate_elastic_chunk_size(file_size: int, workers: int) -> int:
     if file_size == 0: return 1024 * 1024
@@ -18,40 +27,77 @@ def _calculate_elastic_chunk_size(file_size: int, workers: int) -> int:
     MAX_CHUNK = 64 * 1024 * 1024  
     if ideal_size < MIN_CHUNK: ideal_size = MIN_CHUNK
     if ideal_size > MAX_CHUNK: ideal_size = MAX_CHUNK
-    ideal_size = (ideal_size // 16) * 16
-    if ideal_size == 0: ideal_size = 16
+    # Align to 1 MiB, not the 16-byte AES block: what matters for the
+    # mmap workers is page alignment of the slice offsets, and a 1 MiB
+    # multiple is also an exact number of AES-NI 8-block (128-byte)
+    # batches so the CTR kernel never sees a scalar tail except on the
+    # last chunk. MIN_CHUNK keeps the floor at 1 MiB.
+    ideal_size = (ideal_size >> 20) << 20
     return int(ideal_size)
 
+def _encrypt_one(args):
+    # ProcessPool worker entry: module-level hona zaroori hai (pickling).
+    # store=False - key parent mein ek baar bulk-commit hoti hai, warna
+    # N workers VAULT_DB pe likhne ke liye contend karte.
+    src, outp, mode, key_id, key, master_secret = args
+    # write_meta=False: meta parent ko return hota hai jo poore batch ka
+    # ek combined manifest.json likhta hai (N chhoti writes ki jagah 1)
+    return encrypt_stream(src, outp, mode, key_id, key, master_secret,
+                          store=False, write_meta=False)
+
+def _pool_warmup():
+    # Runs once per worker at pool start: pay the cryptography/hashlib
+    # import tax here instead of on the first real chunk.
+    import cryptography.hazmat.primitives.ciphers  # noqa: F401
+    from . import chunked_ctr  # noqa: F401
+
+def _make_worker_pool(workers: int) -> ProcessPoolExecutor:
+    # forkserver (where available) skips re-running module-level init in
+    # every worker while avoiding fork()-ing the full parent heap.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+    else:
+        ctx = None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                               initializer=_pool_warmup)
+
 def run_encrypt(in_dir: str, out_dir: str, mode: str, master_secret: str,
                 workers: int=4, 
                 use_processes: bool=False, 
                 policy: str='priority', 
                 chunk_size: int = (DEFAULT_CHUNK_MB * 1024 * 1024),
-                scheduler=None, 
-                executor=None
-                ) -> Tuple[float, str]: 
+                scheduler=None,
+                executor=None,
+                archive_fmt: str='auto'
+                ) -> Tuple[float, str]:
     
     t_start = time.time() 
     in_dir = Path(in_dir)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     
-    files = [p for p in in_dir.rglob("*") if p.is_file()]
-    if not files: return 0.0, ""
+    # scandir enumeration: sizes readdir ke saath cached aate hain,
+    # toh neeche plan/fifo branch mein koi stat syscall nahi lagta
+    entries = [(p, st.st_size) for p, st in iter_entries(in_dir)]
+    if not entries: return 0.0, ""
 
     # --- PLAN ---
     current_scheduler = scheduler if scheduler else SchedulerPlus(max_workers=workers)
 
     if policy == 'priority':
-        plan = current_scheduler.plan(files) 
+        plan = current_scheduler.plan([p for p, _ in entries],
+                                      [s for _, s in entries])
     else:
-        plan = [Task(prio=idx, path=p, size=p.stat().st_size, suffix=p.suffix.lower()) 
-                for idx, p in enumerate(files)]
+        plan = [Task(prio=idx, path=p, size=s, suffix=p.suffix.lower())
+                for idx, (p, s) in enumerate(entries)]
 
     in_dir_hash = hashlib.sha256(str(in_dir).encode()).hexdigest()[:16]
     key_id = f"{in_dir_hash}-{mode}-{int(t_start)}"
-    key = gen_key() 
-    
+    key = gen_key()
+    # Poore batch ki files ek hi key share karti hain - vault commit
+    # (fsync) ek baar yahin, har encrypt_stream call mein nahi.
+    store_keys_bulk(master_secret, [(key_id, key, mode)])
+
     # Threshold lowered to 16MB because Elastic Chunking is efficient
     HEAVY_THRESHOLD = 16 * 1024 * 1024 
     
@@ -64,6 +110,25 @@ def run_encrypt(in_dir: str, out_dir: str, mode: str, master_secret: str,
         else:
             small_tasks.append(t)
 
+    # One warm pool for the whole batch: small files fan out on it (GIL
+    # bypass - AES-NI sab cores pe), big files ke chunks bhi isi pe
+    # jaate hain. Without a global executor, encrypt_file_chunked would
+    # otherwise spin up (and tear down) a fresh ProcessPoolExecutor per
+    # file, paying worker cold-start per big task instead of once.
+    own_pool = None
+    pool_for_batch = executor
+    needs_pool = big_tasks or (use_processes and len(small_tasks) > 1)
+    if pool_for_batch is None and needs_pool:
+        own_pool = _make_worker_pool(workers)
+        pool_for_batch = own_pool
+
+    # Stream files ka metadata parent mein jama hota hai aur batch ke
+    # end pe EK manifest.json banta hai - pehle har file apna
+    # .meta.json likhti thi (N opens + fsyncs encryption ke beech).
+    # Keys = .enc ka out_dir-relative path. Chunked files apna
+    # CTR_CHUNKED manifest khud likhti hain (MAC sidecar ke saath).
+    all_meta = {}
+
     # --- 1. SMALL TASKS STRATEGY ---
     if small_tasks:
         # OPTIMIZATION A: The "Inline" Shortcut
@@ -76,14 +141,40 @@ def run_encrypt(in_dir: str, out_dir: str, mode: str, master_secret: str,
             outp = out_dir / rel.with_suffix(rel.suffix + ".enc")
             outp.parent.mkdir(parents=True, exist_ok=True)
             try:
-                encrypt_stream(str(p), str(outp), mode, key_id, key, master_secret)
-                current_scheduler.observe(p, 0.001) # Minimal cost
+                md = encrypt_stream(str(p), str(outp), mode, key_id, key, master_secret,
+                                    store=False, write_meta=False)
+                all_meta[str(outp.relative_to(out_dir))] = md
+                current_scheduler.observe(p, 0.001, task.size) # Minimal cost
             except Exception as e:
                 print(f"Error {p}: {e}")
         
-        # OPTIMIZATION B: The "Hyper-Threaded" Batch
-        # For multiple small files, we are I/O bound (waiting for disk).
-        # We increase workers to 4x to keep the disk queue full.
+        # OPTIMIZATION B: Fan-out on the process pool.
+        # CPU-bound AES work bypasses the GIL entirely: each small file
+        # becomes one pool task (key bytes pickle once per submission,
+        # vault write parent mein already ho chuki hai).
+        elif use_processes and pool_for_batch is not None:
+            futures = {}
+            for task in small_tasks:
+                p = task.path
+                rel = p.relative_to(in_dir)
+                outp = out_dir / rel.with_suffix(rel.suffix + ".enc")
+                outp.parent.mkdir(parents=True, exist_ok=True)
+
+                f = pool_for_batch.submit(_encrypt_one,
+                                          (str(p), str(outp), mode, key_id, key, master_secret))
+                futures[f] = (task, str(outp.relative_to(out_dir)))
+
+            for f in as_completed(futures):
+                task, rel_key = futures[f]
+                p = task.path
+                try:
+                    all_meta[rel_key] = f.result()
+                    current_scheduler.observe(p, 0.01, task.size)
+                except Exception as e:
+                    print(f"Error {p}: {e}")
+
+        # Thread fallback: agar processes off hain toh I/O-bound batch
+        # ke liye 4x workers disk queue full rakhte hain.
         else:
             with ThreadPoolExecutor(max_workers=workers * 4) as tex:
                 futures = {}
@@ -92,16 +183,18 @@ def run_encrypt(in_dir: str, out_dir: str, mode: str, master_secret: str,
                     rel = p.relative_to(in_dir)
                     outp = out_dir / rel.with_suffix(rel.suffix + ".enc")
                     outp.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    f = tex.submit(encrypt_stream, str(p), str(outp), mode, key_id, key, master_secret)
-                    futures[f] = p
+
+                    f = tex.submit(encrypt_stream, str(p), str(outp), mode, key_id, key,
+                                   master_secret, store=False, write_meta=False)
+                    futures[f] = (task, str(outp.relative_to(out_dir)))
 
                 for f in as_completed(futures):
-                    p = futures[f]
-                    try: 
-                        f.result()
-                        current_scheduler.observe(p, 0.01) 
-                    except Exception as e: 
+                    task, rel_key = futures[f]
+                    p = task.path
+                    try:
+                        all_meta[rel_key] = f.result()
+                        current_scheduler.observe(p, 0.01, task.size)
+                    except Exception as e:
                         print(f"Error {p}: {e}")
 
     # --- 2. LARGE TASKS STRATEGY (ProcessPool + Elastic Chunking) ---
@@ -111,31 +204,73 @@ def run_encrypt(in_dir: str, out_dir: str, mode: str, master_secret: str,
             rel = p.relative_to(in_dir)
             outp = out_dir / rel.with_suffix(rel.suffix + ".enc")
             outp.parent.mkdir(parents=True, exist_ok=True)
-            
+
             # Elastic Chunking
             elastic_chunk = _calculate_elastic_chunk_size(task.size, workers)
-            
+
             t0 = time.time()
             try:
                 encrypt_file_chunked(
                     src=p, dst=outp, key=key, key_id=key_id,
                     master_secret=master_secret,
-                    chunk_size=elastic_chunk, 
+                    chunk_size=elastic_chunk,
                     workers=workers,
                     use_processes=True,
-                    executor=executor
+                    executor=pool_for_batch,
+                    store=False
                 )
                 elapsed = time.time() - t0
-                current_scheduler.observe(p, elapsed)
+                current_scheduler.observe(p, elapsed, task.size)
             except Exception as e:
                 print(f"Error Chunked {p}: {e}")
 
+    if own_pool is not None:
+        own_pool.shutdown()
+
+    if all_meta:
+        manifest_p = out_dir / "manifest.json"
+        if orjson is not None:
+            manifest_p.write_bytes(orjson.dumps(all_meta, option=orjson.OPT_INDENT_2))
+        else:
+            manifest_p.write_text(json.dumps(all_meta, indent=2))
+
     t_end_encryption = time.time()
     archive_name = f"encrypted_{policy}_{int(t_start)}.zip"
-    arch_path = make_archive(out_dir, archive_name=archive_name)
+    arch_path = make_archive(out_dir, archive_name=archive_name, fmt=archive_fmt)
     
     return (t_end_encryption - t_start), arch_path
 
+def replay_schedule(in_dir: str, workers: int=4, policy: str='priority',
+                    scheduler=None) -> float:
+    # Sirf scheduling ka kharcha napo: enumerate + plan/dispatch order,
+    # encrypt_stream bilkul nahi. /api/compare isse policies ka pure
+    # scheduler overhead naap leta hai bina AES/I/O dobara kiye.
+    in_dir = Path(in_dir)
+    t0 = time.perf_counter()
+    entries = [(p, st.st_size) for p, st in iter_entries(in_dir)]
+    if policy == 'priority':
+        sched = scheduler if scheduler else SchedulerPlus(max_workers=workers)
+        sched.plan([p for p, _ in entries], [s for _, s in entries])
+    else:
+        [Task(prio=idx, path=p, size=s, suffix=p.suffix.lower())
+         for idx, (p, s) in enumerate(entries)]
+    return time.perf_counter() - t0
+
+def link_tree(src_dir: Path, dst_dir: Path):
+    # Identical outputs ke liye dusri copy hard links se: zero extra
+    # bytes on disk, zero copy time (cross-device pe copy fallback)
+    src_dir = Path(src_dir)
+    dst_dir = Path(dst_dir)
+    for p, _ in iter_entries(src_dir):
+        rel = p.relative_to(src_dir)
+        target = dst_dir / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(p, target)
+        except OSError:
+            import shutil
+            shutil.copy2(p, target)
+
 # (run_decrypt remains unchanged from previous version, assuming you have it)
 def run_decrypt(in_dir: str, out_dir: str, master_secret: str, workers: int=4, 
                 use_processes: bool=False, executor=None):
@@ -143,42 +278,74 @@ def run_decrypt(in_dir: str, out_dir: str, master_secret: str, workers: int=4,
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     files = [p for p in in_dir.rglob("*.enc") if p.is_file()]
+    root = in_dir
     if not files:
         payload = in_dir / "payload"
-        if payload.exists(): files = [p for p in payload.rglob("*.enc") if p.is_file()]
-    
+        if payload.exists():
+            files = [p for p in payload.rglob("*.enc") if p.is_file()]
+            root = payload
+
+    # Batch manifest (ek combined JSON) pehle try karo; na mile toh
+    # purane per-file .meta.json fallback se kaam chalta hai
+    manifest_map = {}
+    man = root / "manifest.json"
+    if man.exists():
+        try:
+            if orjson is not None:
+                manifest_map = orjson.loads(man.read_bytes())
+            else:
+                manifest_map = json.loads(man.read_text())
+        except Exception:
+            manifest_map = {}
+
+    # Chunked files are driven from the parent so their per-chunk tasks
+    # can fan out on the executor; executors themselves don't pickle, so
+    # submitting decrypt_file_chunked(executor=...) to a process pool
+    # silently failed before.
+    chunked_tasks = []
     if executor and use_processes:
         futures = []
         for p in files:
-            _submit_decrypt_task(p, in_dir, out_dir, master_secret, workers, use_processes, futures, executor)
+            _submit_decrypt_task(p, in_dir, out_dir, master_secret, futures, executor, chunked_tasks,
+                                 manifest_map.get(str(p.relative_to(root))))
         for f in as_completed(futures):
             try: f.result()
             except: pass
+        for p, outp, key_id in chunked_tasks:
+            decrypt_file_chunked(p, outp, key_id, master_secret, use_processes, workers, executor)
     else:
         exec_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
         with exec_cls(max_workers=workers) as ex:
             futures = []
             for p in files:
-                _submit_decrypt_task(p, in_dir, out_dir, master_secret, workers, use_processes, futures, ex)
+                _submit_decrypt_task(p, in_dir, out_dir, master_secret, futures, ex, chunked_tasks,
+                                     manifest_map.get(str(p.relative_to(root))))
             for f in as_completed(futures):
                 try: f.result()
                 except: pass
+            for p, outp, key_id in chunked_tasks:
+                decrypt_file_chunked(p, outp, key_id, master_secret, use_processes, workers,
+                                     ex if use_processes else None)
 
-def _submit_decrypt_task(p, in_dir, out_dir, master_secret, workers, use_processes, futures_list, executor):
+def _submit_decrypt_task(p, in_dir, out_dir, master_secret, futures_list, executor, chunked_tasks, md=None):
     rel = p.relative_to(in_dir)
     outp_name = ".".join(rel.name.split('.')[:-1]) if '.enc' in rel.name else rel.name + ".dec"
-    meta = p.with_suffix(p.suffix + ".meta.json")
     key_id, is_chunked = None, False
-    if meta.exists():
-        try:
-            md = json.loads(meta.read_text())
-            if "src" in md: outp_name = md["src"]
-            key_id = md.get("key_id")
-            is_chunked = md.get("mode") == "CTR_CHUNKED"
-        except: pass
+    # md batch manifest se aata hai; na mile toh legacy per-file
+    # .meta.json padho (purane archives / chunked CTR files)
+    if md is None:
+        meta = p.with_suffix(p.suffix + ".meta.json")
+        if meta.exists():
+            try:
+                md = json.loads(meta.read_text())
+            except: md = None
+    if md:
+        if "src" in md: outp_name = md["src"]
+        key_id = md.get("key_id")
+        is_chunked = md.get("mode") == "CTR_CHUNKED"
     outp = out_dir / rel.parent / outp_name
     outp.parent.mkdir(parents=True, exist_ok=True)
     if is_chunked:
-        futures_list.append(executor.submit(decrypt_file_chunked, p, outp, key_id, master_secret, use_processes, workers, executor))
+        chunked_tasks.append((p, outp, key_id))
     else:
         futures_list.append(executor.submit(decrypt_file, str(p), str(outp), key_id, master_secret))
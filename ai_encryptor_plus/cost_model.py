@@ -22,6 +22,14 @@ class CostModel:
         # chunk_size aur suffix pass karte hain; sample optional hai.
         return self.adaptive.predict(chunk_size, suffix, sample)
 
+    def predict_seconds_batch(self, sizes, suffixes):
+        """
+        Batch predict: parallel lists of sizes/suffixes -> list of costs.
+        """
+        # Scheduler poore batch ka cost ek call mein le leta hai,
+        # per-file method-call overhead khatam.
+        return self.adaptive.predict_batch(sizes, suffixes)
+
     def observe(self, *, chunk_size: int, suffix: str, actual_s: float, sample=None):
         """
         Update model with real observed time.
@@ -1,81 +1,124 @@
 import os, json, hashlib
 from pathlib import Path
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .encryptor import MAGIC, HDR
 from .key_vault import load_key
 
-def _aes_ctr(key: bytes, nonce16: bytes, data: bytes) -> bytes:
-    cipher = Cipher(algorithms.AES(key), modes.CTR(nonce16))
-    dec = cipher.decryptor()
-    return dec.update(data) + dec.finalize()
-
-def _aes_gcm_decrypt(key: bytes, nonce12: bytes, data: bytes) -> bytes:
-    a = AESGCM(key)
-    return a.decrypt(nonce12, data, None)
+# Streaming decrypt ka read granularity - encryptor ke default se match
+DEC_CHUNK = 1024 * 1024
 
 # --- MODIFICATION ---
 # Added 'master_secret' argument.
 def decrypt_file(enc_path: str, out_path: str, key_id: str=None, master_secret: str = None):
     ep = Path(enc_path)
     meta = ep.with_suffix(ep.suffix + ".meta.json")
-    header = None
-    with open(enc_path, "rb") as f:
-        header = f.read(3)
-        if not header:
-            raise ValueError("Empty file")
-        if header == b"CTR":
-            nonce = f.read(16)
-            ct = f.read()
-            mode = "CTR"
-        elif header == b"GCM":
-            nonce = f.read(12)
-            ct = f.read()
-            mode = "GCM"
-        elif header == b"CBC":
-            iv = f.read(16)
-            ct = f.read()
-            mode = "CBC"
-        else:
-            raise ValueError("Unknown header")
-    # load key
-    if key_id is None:
+    # Meta hamesha try karo (sirf key_id ke liye nahi): stored nonce/iv
+    # neeche header-format detection ko disambiguate karta hai.
+    md = None
+    if meta.exists():
+        try:
+            md = json.loads(meta.read_text())
+        except Exception:
+            md = None
+    if key_id is None and md:
         # try to find key id from meta
-        if meta.exists():
-            try:
-                md = json.loads(meta.read_text())
-                key_id = md.get("key_id")
-            except Exception:
-                key_id = None
+        key_id = md.get("key_id")
     if not key_id:
         raise KeyError("key_id required or not found in .meta.json")
-    
+
     # --- MODIFICATION ---
     if not master_secret:
         raise ValueError("Master secret is required for decryption")
     key, stored_mode = load_key(key_id, master_secret)
     # --- END MODIFICATION ---
 
-    if stored_mode and stored_mode.lower() != mode.lower():
-        # allow modes difference but warn
-        pass
     out_p = Path(out_path)
     tmp = out_p.with_suffix(out_p.suffix + ".tmp")
-    if mode == "CTR":
-        pt = _aes_ctr(key, nonce, ct)
-        with open(tmp, "wb") as g:
-            g.write(pt)
-    elif mode == "GCM":
-        pt = _aes_gcm_decrypt(key, nonce, ct)
-        with open(tmp, "wb") as g:
-            g.write(pt)
-    elif mode == "CBC":
-        # unpad
-        from cryptography.hazmat.primitives import padding
-        ch = Cipher(algorithms.AES(key), modes.CBC(iv))
-        dec = ch.decryptor()
-        padded = dec.update(ct) + dec.finalize()
-        unpad = padding.PKCS7(128).unpadder()
-        pt = unpad.update(padded) + unpad.finalize()
-        with open(tmp, "wb") as g:
-            g.write(pt)
+    # Puri ciphertext ab RAM mein nahi aati: update_into ek reusable
+    # buffer mein likhta hai aur hum chunk-by-chunk stream karte hain.
+    with open(enc_path, "rb") as f, open(tmp, "wb") as g:
+        # Naye files ek fixed 20-byte header rakhte hain: 4-byte magic
+        # (tag + version \x01) + 16-byte nonce/iv slot, HDR struct se
+        # packed. Purane files 3-byte magic + raw-length nonce the -
+        # wahan 4th byte nonce ka pehla byte hai, toh legacy branch use
+        # wapas nonce mein jod deta hai.
+        head = f.read(4)
+        if len(head) < 4:
+            raise ValueError("Empty file")
+        mode_tag = head[:3]
+        new_fmt = head in MAGIC.values()
+        if new_fmt:
+            _, slot = HDR.unpack(head + f.read(16))
+            # 1-in-256 trap: legacy file jiska random nonce/iv \x01 se
+            # shuru hota hai, naya magic bankar yahan aa jaata hai -
+            # CTR ke liye woh chupchaap garbage decrypt kar deta. Meta
+            # mein nonce/iv hex stored hai, usse tie-break karo: slot
+            # match nahi hua toh yeh legacy layout hai, wapas seek karo.
+            stored_hex = md.get("nonce") or md.get("iv") if md else None
+            if stored_hex:
+                try:
+                    stored = bytes.fromhex(stored_hex)
+                except ValueError:
+                    stored = None
+                if stored and slot != stored.ljust(16, b"\x00"):
+                    new_fmt = False
+                    f.seek(4)
+        buf = bytearray(DEC_CHUNK + 32)
+        mv = memoryview(buf)
+        if mode_tag == b"CTR":
+            nonce = slot if new_fmt else head[3:] + f.read(15)
+            dec = Cipher(algorithms.AES(key), modes.CTR(nonce)).decryptor()
+            while True:
+                chunk = f.read(DEC_CHUNK)
+                if not chunk: break
+                n = dec.update_into(chunk, mv)
+                g.write(mv[:n])
+            dec.finalize()
+        elif mode_tag == b"GCM":
+            # GCM ka real nonce 12 bytes ka hai - naye header mein woh
+            # 16-byte slot mein zero-padded baitha hai.
+            nonce = slot[:12] if new_fmt else head[3:] + f.read(11)
+            hdr_len = HDR.size if new_fmt else 3 + 12
+            # Tag file ke tail pe hai (encryptor streaming mein bhi wahi
+            # layout likhta hai jo one-shot AESGCM deta tha).
+            total = os.fstat(f.fileno()).st_size
+            ct_len = total - hdr_len - 16
+            if ct_len < 0:
+                raise ValueError("Truncated GCM file")
+            f.seek(total - 16)
+            tag = f.read(16)
+            f.seek(hdr_len)
+            dec = Cipher(algorithms.AES(key), modes.GCM(nonce, tag)).decryptor()
+            remaining = ct_len
+            while remaining:
+                chunk = f.read(min(DEC_CHUNK, remaining))
+                if not chunk:
+                    raise ValueError("Truncated GCM file")
+                remaining -= len(chunk)
+                n = dec.update_into(chunk, mv)
+                g.write(mv[:n])
+            dec.finalize()  # yahan tag verify hota hai
+        elif mode_tag == b"CBC":
+            iv = slot if new_fmt else head[3:] + f.read(15)
+            dec = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+            # Aakhri plaintext chunk hold-back: PKCS7 pad sirf usi se
+            # strip hota hai, baaki chunks seedha likh do.
+            held = None
+            while True:
+                chunk = f.read(DEC_CHUNK)
+                if not chunk: break
+                n = dec.update_into(chunk, mv)
+                if n:
+                    if held is not None:
+                        g.write(held)
+                    held = bytes(mv[:n])
+            dec.finalize()
+            if not held:
+                raise ValueError("Truncated CBC file")
+            pad = held[-1]
+            if not 1 <= pad <= 16:
+                raise ValueError("Invalid PKCS7 padding")
+            g.write(memoryview(held)[:len(held) - pad])
+        else:
+            raise ValueError("Unknown header")
     os.replace(str(tmp), str(out_p))
@@ -1,28 +1,44 @@
-import os, secrets, hashlib, json
+import os, secrets, hashlib, json, mmap, struct
+from collections import deque
 from pathlib import Path
 from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from .key_vault import store_key
 
+# Fixed-width 20-byte header sab modes ke liye: 4-byte magic (3-char
+# tag + version \x01) aur 16-byte nonce/iv slot (GCM ka 12-byte nonce
+# zero-pad hota hai). Decryptor ek read(20) + unpack se parse karta
+# hai, purane variable-length b"CTR"+nonce concat headers ki jagah.
+# GCM tag pehle ki tarah file ke tail pe hi rehta hai.
+MAGIC = {"CTR": b"CTR\x01", "GCM": b"GCM\x01", "CBC": b"CBC\x01"}
+HDR = struct.Struct("<4s16s")
+
+# Isse badi CTR files threads pe fan-out hoti hain; chhoti files ke
+# liye thread startup overhead hi jeet kha jata hai
+_PARALLEL_CTR_MIN = 8 * 1024 * 1024
+
 def gen_key() -> bytes:
     # 32 bytes = 256 bits AES key generate karo
     return secrets.token_bytes(32)  # AES-256
 
-def _aes_ctr(key: bytes, nonce16: bytes, data: bytes) -> bytes:
-    # CTR mode mein encryption karo
-    cipher = Cipher(algorithms.AES(key), modes.CTR(nonce16))
-    enc = cipher.encryptor()
-    return enc.update(data) + enc.finalize()
-
-def _aes_gcm(key: bytes, nonce12: bytes, data: bytes) -> bytes:
-    # GCM mode mein authenticated encryption karo
-    a = AESGCM(key)
-    return a.encrypt(nonce12, data, None)
+def _ctr_encrypt_span(key: bytes, nonce: bytes, mv, start: int, end: int) -> bytearray:
+    # CTR counter offset ke hisaab se aage badhta hai: byte `start` pe
+    # block counter base + start/16 hota hai, toh har span apna
+    # encryptor wahi se seed karke independently chal sakta hai.
+    # OpenSSL update() ke dauran GIL chhod deta hai, isliye threads
+    # genuinely parallel AES-NI chalate hain.
+    base = int.from_bytes(nonce, "big")
+    ctr = ((base + start // 16) & ((1 << 128) - 1)).to_bytes(16, "big")
+    enc = Cipher(algorithms.AES(key), modes.CTR(ctr)).encryptor()
+    out = bytearray(end - start)
+    enc.update_into(mv[start:end], out)
+    enc.finalize()
+    return out
 
 # --- MODIFICATION ---
 # Added 'master_secret' argument.
-def encrypt_stream(path: str, out_path: str, mode: str, key_id: str, key: bytes, master_secret: str, chunk_size_bytes: int=1024*1024):
+def encrypt_stream(path: str, out_path: str, mode: str, key_id: str, key: bytes, master_secret: str, chunk_size_bytes: int=1024*1024, store: bool=True, write_meta: bool=True):
     # Temp file mein likho phir atomic replace karo
     out_p = Path(out_path)
     tmp = out_p.with_suffix(out_p.suffix + ".tmp")
@@ -32,60 +48,182 @@ def encrypt_stream(path: str, out_path: str, mode: str, key_id: str, key: bytes,
     base_meta = {"key_id": key_id, "src": Path(path).name}
     
     with open(path, "rb") as f, open(tmp, "wb") as g:
+        # Ek reusable output buffer sab modes ke liye: update_into isme
+        # likhta hai, toh per-chunk fresh bytes object nahi banta aur
+        # puri file kabhi RAM mein load nahi hoti. +32 headroom: CBC ka
+        # padded tail chunk len+block-1 bytes ka output space maangta hai.
+        buf = bytearray(chunk_size_bytes + 32)
+        mv = memoryview(buf)
         if mode.lower() == "ctr":
             # CTR mode: random nonce generate karo
             nonce = secrets.token_bytes(16)
-            g.write(b"CTR"+nonce)  # header likho
-            while True:
-                chunk = f.read(chunk_size_bytes)
-                if not chunk: break
-                g.write(_aes_ctr(key, nonce, chunk))
+            g.write(HDR.pack(MAGIC["CTR"], nonce))  # header likho
+            # Ek hi encryptor puri file ke liye: counter chunks ke across
+            # continue hota hai (pehle har chunk counter restart karta
+            # tha - galat ciphertext + har 1MB pe naya EVP context).
+            # Key schedule ek baar expand hota hai, AES-NI pipeline hot
+            # rehti hai.
+            size = os.fstat(f.fileno()).st_size
+            # Span size block-aligned hona chahiye warna counter math
+            # galat block pe land karta hai (default 1MB already hai)
+            cs = max(chunk_size_bytes & ~15, 16)
+            if size > _PARALLEL_CTR_MIN:
+                # CTR embarrassingly parallel hai: mmap se spans slice
+                # karke threads pe chalao, results submission order mein
+                # likho. Ek core ki AES-NI speed ka cap hat jata hai.
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    src = memoryview(mm)
+                    spans = [(s, min(s + cs, size)) for s in range(0, size, cs)]
+                    # Bounded in-flight window: sab spans ek saath submit
+                    # karne pe AES disk se aage nikal jaata hai aur
+                    # completed-but-unwritten bytearrays worst case puri
+                    # file jitni RAM kha lete (jo chunk1-2 ne khatam kiya
+                    # tha). ~2x workers in flight rakhte hain: pipeline
+                    # full, peak memory O(window * span).
+                    nworkers = os.cpu_count() or 4
+                    window = 2 * nworkers
+                    with ThreadPoolExecutor(max_workers=nworkers) as tex:
+                        pending = deque(tex.submit(_ctr_encrypt_span, key, nonce, src, s, e)
+                                        for s, e in spans[:window])
+                        nxt = window
+                        while pending:
+                            g.write(pending.popleft().result())
+                            if nxt < len(spans):
+                                s, e = spans[nxt]
+                                pending.append(tex.submit(_ctr_encrypt_span, key, nonce, src, s, e))
+                                nxt += 1
+                    src.release()
+                finally:
+                    mm.close()
+            else:
+                enc = Cipher(algorithms.AES(key), modes.CTR(nonce)).encryptor()
+                while True:
+                    chunk = f.read(cs)
+                    if not chunk: break
+                    n = enc.update_into(chunk, mv)
+                    g.write(mv[:n])
+                g.write(enc.finalize())
             meta_data = {**base_meta, "mode":"CTR","nonce":nonce.hex(),"chunked":False}
         elif mode.lower() == "gcm":
-            # GCM mode: puri file ek saath encrypt karo (tag ke liye)
-            data = f.read()
+            # GCM bhi ab streaming: one-shot AESGCM puri file maangta
+            # tha. Low-level GCM encryptor chunk-by-chunk chalta hai aur
+            # tag end mein aata hai - ciphertext+tag layout wahi hai jo
+            # AESGCM.encrypt() deta tha, toh file format same rehta hai.
             nonce = secrets.token_bytes(12)
-            ct = _aes_gcm(key, nonce, data)
-            g.write(b"GCM"+nonce+ct)
+            g.write(HDR.pack(MAGIC["GCM"], nonce.ljust(16, b"\x00")))
+            enc = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+            while True:
+                chunk = f.read(chunk_size_bytes)
+                if not chunk: break
+                n = enc.update_into(chunk, mv)
+                g.write(mv[:n])
+            enc.finalize()
+            g.write(enc.tag)  # 16-byte tag file ke tail pe
             meta_data = {**base_meta, "mode":"GCM","nonce":nonce.hex(),"chunked":False}
         else:
-            # CBC mode: puri file padding ke saath encrypt karo
-            from cryptography.hazmat.primitives import padding
-            data = f.read()
-            padder = padding.PKCS7(128).padder()
-            padded = padder.update(data) + padder.finalize()
+            # CBC streaming: sirf aakhri chunk ko PKCS7 pad chahiye, toh
+            # ek chunk lookahead rakho aur EOF pe pad inline karo.
             iv = secrets.token_bytes(16)
-            ch = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
-            ct = ch.update(padded) + ch.finalize()
-            g.write(b"CBC"+iv+ct)
+            g.write(HDR.pack(MAGIC["CBC"], iv))
+            enc = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+            chunk = f.read(chunk_size_bytes)
+            while True:
+                nxt = f.read(chunk_size_bytes)
+                if not nxt:
+                    pad = 16 - (len(chunk) % 16)
+                    chunk = chunk + bytes([pad]) * pad
+                    n = enc.update_into(chunk, mv)
+                    g.write(mv[:n])
+                    break
+                n = enc.update_into(chunk, mv)
+                g.write(mv[:n])
+                chunk = nxt
+            enc.finalize()
             meta_data = {**base_meta, "mode":"CBC","iv":iv.hex(),"chunked":False}
     
     # File replace karo atomically
     os.replace(str(tmp), str(out_p))
-    try:
-        # Metadata JSON file mein save karo
-        with open(meta, "w") as m:
-            json.dump(meta_data, m, indent=2)
-    except Exception:
-        pass
-    
+    if write_meta:
+        try:
+            # Metadata JSON file mein save karo (standalone callers ke
+            # liye; batch path ek combined manifest.json likhta hai)
+            with open(meta, "w") as m:
+                json.dump(meta_data, m, indent=2)
+        except Exception:
+            pass
+
     # --- MODIFICATION ---
-    # Pass 'master_secret' to store_key.
-    store_key(key_id, key, mode, master_secret)
+    # Pass 'master_secret' to store_key. Batch callers jo key ek baar
+    # store_keys_bulk se likh chuke hain, store=False dete hain - warna
+    # har file ek redundant vault commit (fsync) karti.
+    if store:
+        store_key(key_id, key, mode, master_secret)
+
+    return meta_data
 
 def encrypt_file_whole_cbc(src: Path, dst: Path, key: bytes):
-    # Puri file ko CBC mode mein encrypt karo
-    from cryptography.hazmat.primitives import padding
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    import secrets
-    data = src.read_bytes()
-    padder = padding.PKCS7(128).padder()
-    padded = padder.update(data) + padder.finalize()
+    # Puri file ko CBC mode mein encrypt karo - mmap slices update_into
+    # se stream hoti hain. Pehle read_bytes + padder copy + ct concat
+    # ka peak RAM ~3x filesize tha; ab O(1MB), read-ahead page cache
+    # sambhalta hai. PKCS7 sirf aakhri block pe lagta hai toh tail
+    # manually pad hota hai.
     iv = secrets.token_bytes(16)
-    ch = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
-    ct = ch.update(padded) + ch.finalize()
     tmp = dst.with_suffix(dst.suffix + ".tmp")
-    with open(tmp, "wb") as g:
-        g.write(b"CBC"+iv+ct)
+    cs = 1 << 20
+    with open(src, "rb") as sf, open(tmp, "wb") as g:
+        g.write(HDR.pack(MAGIC["CBC"], iv))
+        enc = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        size = os.fstat(sf.fileno()).st_size
+        buf = bytearray(cs + 32)
+        mv = memoryview(buf)
+        tail = b""
+        if size:
+            mm = mmap.mmap(sf.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                src_mv = memoryview(mm)
+                i = 0
+                while i + cs <= size:
+                    n = enc.update_into(src_mv[i:i+cs], mv)
+                    g.write(mv[:n])
+                    i += cs
+                tail = bytes(src_mv[i:])
+                src_mv.release()
+            finally:
+                mm.close()
+        pad = 16 - (len(tail) % 16)
+        n = enc.update_into(tail + bytes([pad]) * pad, mv)
+        g.write(mv[:n])
+        enc.finalize()
     # Atomically replace karo
     os.replace(str(tmp), str(dst))
+
+def _selfcheck():
+    # OpenSSL build + AES-NI sanity: hardware path engaged ho toh CTR
+    # multi-GB/s deta hai; <500 MB/s ka matlab software fallback chal
+    # raha hai (slow build / exotic platform) - operator ko warn karo
+    # taaki regression chupke se na ghus jaaye.
+    import time, warnings
+    from cryptography.hazmat.backends import default_backend
+    try:
+        print(f"[afe-selfcheck] {default_backend().openssl_version_text()}")
+    except Exception:
+        pass
+    key = b"\x00" * 32
+    nonce = b"\x00" * 16
+    data = bytes(16 * 1024 * 1024)
+    out = bytearray(len(data))
+    enc = Cipher(algorithms.AES(key), modes.CTR(nonce)).encryptor()
+    t = time.perf_counter()
+    enc.update_into(data, out)
+    dt = time.perf_counter() - t
+    mb_s = (len(data) / (1 << 20)) / max(dt, 1e-9)
+    print(f"[afe-selfcheck] AES-256-CTR: {mb_s:.0f} MB/s")
+    if mb_s < 500:
+        warnings.warn(f"AES-NI may not be active: CTR self-bench {mb_s:.0f} MB/s")
+    return mb_s
+
+# Production startup slow na ho isliye env-gated; ops AFE_SELFCHECK=1
+# se kisi bhi deploy pe fast path confirm kar sakte hain
+if os.environ.get("AFE_SELFCHECK") == "1":
+    _selfcheck()
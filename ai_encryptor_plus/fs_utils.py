@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+
+def iter_entries(root):
+    """
+    Recursive os.scandir walk: (Path, stat_result) pairs yield karta hai.
+    """
+    # rglob ke Path objects pe phir se .stat() karna padta tha - ek
+    # extra syscall per file. DirEntry ka stat readdir ke saath cached
+    # aata hai, toh hazaron small files pe enumeration ke syscalls
+    # aadhe ho jaate hain. Callers ko size/mtime yahin se mil jaata hai.
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        # File symlinks follow hote hain (purana rglob
+                        # bhi karta tha - warna linked inputs chupchaap
+                        # output se gayab ho jaate). Directory recursion
+                        # hi follow_symlinks=False rehta hai, taaki
+                        # symlink loop infinite walk na bana de.
+                        yield Path(entry.path), entry.stat()
+        except OSError:
+            # race mein gayab hua directory skip karo
+            continue
@@ -1,30 +1,96 @@
 from __future__ import annotations
-import os, sqlite3, secrets, time
+import os, sqlite3, secrets, time, functools, threading, atexit
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from .config import VAULT_DB, MASTER_ENV
 
+# Argon2id optional hai: memory-hardness GPU crackers ko neutralize
+# karti hai jahan PBKDF2 sirf iteration count pe depend karta hai.
+# Package na ho toh v2 (PBKDF2 master + HKDF) pe rehte hain.
+try:
+    from argon2.low_level import hash_secret_raw as _argon2_raw, Type as _Argon2Type
+except ImportError:
+    _argon2_raw = None
+
+# Vault rows likhte waqt kaunsa KDF scheme use hota hai:
+#   1 = legacy, per-row PBKDF2(master, row_salt) - 200k rounds HAR call pe
+#   2 = ek cached PBKDF2 master-of-masters + cheap per-row HKDF-Expand
+#   3 = cached Argon2id master-of-masters + per-row HKDF-Expand
+KDF_VER = 3 if _argon2_raw is not None else 2
+_MASTER_SALT = b"afecrypt-vault-master-v2"
+
 def _kdf(master: str, salt: bytes) -> bytes:
-    # Master secret se encryption key derive karte hain
+    # Master secret se encryption key derive karte hain (legacy v1 path)
     kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=200_000)
     return kdf.derive(master.encode())
 
+@functools.lru_cache(maxsize=4)
+def _master_key(master: str) -> bytes:
+    # 200k-round PBKDF2 sirf ek baar per session master: batch encrypt
+    # mein pehle har file pe ~8ms jalta tha, ab sirf pehli call pe.
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32,
+                     salt=_MASTER_SALT, iterations=200_000)
+    return kdf.derive(master.encode())
+
+@functools.lru_cache(maxsize=4)
+def _master_key_argon2(master: str) -> bytes:
+    # Argon2id: 64 MiB memory-hard, session mein sirf ek baar chalta
+    # hai (cache), toh honest user ~30ms ek hi baar deta hai jabki
+    # attacker ko per-guess 64 MiB chahiye.
+    return _argon2_raw(secret=master.encode(), salt=_MASTER_SALT,
+                       time_cost=3, memory_cost=64 * 1024, parallelism=2,
+                       hash_len=32, type=_Argon2Type.ID)
+
+def _wrap_kdf(master: str, salt: bytes, kdf_ver: int) -> bytes:
+    # Row ke kdf_ver ke hisaab se wrap key derive karo
+    if kdf_ver >= 3:
+        if _argon2_raw is None:
+            raise RuntimeError("argon2-cffi required to unwrap kdf_ver=3 vault rows")
+        master_key = _master_key_argon2(master)
+    elif kdf_ver == 2:
+        master_key = _master_key(master)
+    else:
+        return _kdf(master, salt)
+    # HKDF-Expand microseconds ka hai; per-row salt uniqueness deta hai
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"wrap").derive(master_key)
+
+def clear_kdf_cache():
+    # Explicit logout pe derived masters ko memory se hatao
+    _master_key.cache_clear()
+    if _argon2_raw is not None:
+        _master_key_argon2.cache_clear()
+
 def _aes_cbc_encrypt(k: bytes, iv: bytes, pt: bytes) -> bytes:
-    # Plaintext ko AES-CBC se encrypt karte hain
+    # Plaintext ko AES-CBC se encrypt karte hain. Yahan hamesha ek
+    # 32-byte AES key wrap hoti hai, toh PKCS7 pad hamesha ek full
+    # block hota hai - padder object banane ki zaroorat nahi.
+    assert len(pt) == 32, "vault wrap is specialized for 32-byte keys"
     cipher = Cipher(algorithms.AES(k), modes.CBC(iv))
     enc = cipher.encryptor()
-    padder = padding.PKCS7(128).padder()
-    return enc.update(padder.update(pt) + padder.finalize()) + enc.finalize()
+    return enc.update(pt + b"\x10" * 16) + enc.finalize()
 
 def _aes_cbc_decrypt(k: bytes, iv: bytes, ct: bytes) -> bytes:
-    # Ciphertext ko AES-CBC se decrypt karte hain
+    # Ciphertext ko AES-CBC se decrypt karte hain, pad manually strip
     cipher = Cipher(algorithms.AES(k), modes.CBC(iv))
     dec = cipher.decryptor()
-    unpad = padding.PKCS7(128).unpadder()
-    return unpad.update(dec.update(ct) + dec.finalize()) + unpad.finalize()
+    raw = dec.update(ct) + dec.finalize()
+    pad = raw[-1]
+    if not 1 <= pad <= 16:
+        raise ValueError("Invalid padding in wrapped key")
+    return raw[:-pad]
 
 def _ensure_schema(conn: sqlite3.Connection):
+    # WAL: readers writers ko block nahi karte, aur synchronous=NORMAL
+    # ke saath har commit pe full fsync nahi hota (WAL append + ek
+    # checkpoint kaafi hai). busy_timeout retry-loop ki jagah hai jab
+    # parallel workers vault chhoote hain.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
     # Database table banate hain agar pehle se nahi hai
     conn.execute("""
     CREATE TABLE IF NOT EXISTS keys(
@@ -40,40 +106,93 @@ def _ensure_schema(conn: sqlite3.Connection):
       wrapped_key BLOB NOT NULL,
       mode TEXT NOT NULL
     )""")
+    # Purane vaults mein kdf_ver column nahi hota - add karo, default 1
+    # taaki existing rows legacy PBKDF2 path se hi decrypt hon.
+    try:
+        conn.execute("ALTER TABLE keys ADD COLUMN kdf_ver INTEGER NOT NULL DEFAULT 1")
+    except sqlite3.OperationalError:
+        pass  # column pehle se hai
     conn.commit()
 
+# Per-call sqlite3.connect() har baar file open() + schema parse karta
+# tha. Connection ab thread-local hai (ek baar per thread khulta hai);
+# writes ek lock ke peeche serialize hote hain taaki ek hi thread ke
+# overlapping BEGIN IMMEDIATE na ho.
+_tls = threading.local()
+_lock = threading.Lock()
+
+def _conn() -> sqlite3.Connection:
+    c = getattr(_tls, "c", None)
+    if c is None:
+        c = sqlite3.connect(VAULT_DB, timeout=10.0, isolation_level=None,
+                            check_same_thread=False)
+        _ensure_schema(c)
+        _tls.c = c
+    return c
+
+def _checkpoint_wal():
+    # Shutdown pe WAL ko main db mein merge + truncate karo, warna -wal
+    # file grow hoti rehti hai aur agla process cold open pe replay
+    # karta hai. Vault kabhi bana hi nahi toh kuch mat karo.
+    if not os.path.exists(VAULT_DB):
+        return
+    try:
+        _conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except Exception:
+        pass
+
+atexit.register(_checkpoint_wal)
+
 def init():
     # Database initialize karte hain
-    with sqlite3.connect(VAULT_DB) as c:
-        _ensure_schema(c)
+    _conn()
 
-def store_key(key_id: str, raw_key: bytes, mode: str, master_secret: str) -> None:
-    # Key ko vault mein store karte hain
-    init()
+def store_keys_bulk(master_secret: str, items) -> None:
+    # Poore batch ke keys ek transaction mein: 1 fsync per batch, N nahi.
+    # items = [(key_id, raw_key, mode), ...]
+    if not items:
+        return
     if not master_secret:
         raise ValueError("Master secret cannot be empty for storing a key")
-    
-    import secrets
-    salt = secrets.token_bytes(16)
-    wrap_k = _kdf(master_secret, salt)
-    iv = secrets.token_bytes(16)
-    wrapped = _aes_cbc_encrypt(wrap_k, iv, raw_key)
-    with sqlite3.connect(VAULT_DB, timeout=10.0) as c: # Added timeout
-        c.execute("REPLACE INTO keys(id,created_at,salt,iv,wrapped_key,mode) VALUES(?,?,?,?,?,?)",
-                  (key_id, int(time.time()), salt, iv, wrapped, mode))
-        c.commit()
+    now = int(time.time())
+    rows = []
+    for key_id, raw_key, mode in items:
+        salt = secrets.token_bytes(16)
+        wrap_k = _wrap_kdf(master_secret, salt, KDF_VER)
+        iv = secrets.token_bytes(16)
+        rows.append((key_id, now, salt, iv,
+                     _aes_cbc_encrypt(wrap_k, iv, raw_key), mode, KDF_VER))
+    c = _conn()
+    with _lock:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany("REPLACE INTO keys(id,created_at,salt,iv,wrapped_key,mode,kdf_ver) VALUES(?,?,?,?,?,?,?)",
+                          rows)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+def store_key(key_id: str, raw_key: bytes, mode: str, master_secret: str) -> None:
+    # Single-key convenience wrapper bulk path ke upar
+    store_keys_bulk(master_secret, [(key_id, raw_key, mode)])
 
 def load_key(key_id: str, master_secret: str):
     if not master_secret:
         raise ValueError("Master secret is required to load a key")
 
-    # Database se encrypted key nikaalte hain
-    with sqlite3.connect(VAULT_DB) as c:
-        row = c.execute("SELECT salt,iv,wrapped_key,mode FROM keys WHERE id=?",(key_id,)).fetchone()
-        if not row:
-            raise KeyError(f"key '{key_id}' nahi mila")
-        salt, iv, wrapped, mode = row
+    # Database se encrypted key nikaalte hain - WAL mein readers ko
+    # lock nahi chahiye, thread-local connection seedha use hota hai
+    c = _conn()
+    try:
+        row = c.execute("SELECT salt,iv,wrapped_key,mode,kdf_ver FROM keys WHERE id=?",(key_id,)).fetchone()
+    except sqlite3.OperationalError:
+        # bilkul purana vault jisme init() kabhi dobara nahi chala
+        row = c.execute("SELECT salt,iv,wrapped_key,mode,1 FROM keys WHERE id=?",(key_id,)).fetchone()
+    if not row:
+        raise KeyError(f"key '{key_id}' nahi mila")
+    salt, iv, wrapped, mode, kdf_ver = row
     # Key ko decrypt karte hain aur return karte hain
-    wrap_k = _kdf(master_secret, salt)
+    wrap_k = _wrap_kdf(master_secret, salt, kdf_ver)
     raw = _aes_cbc_decrypt(wrap_k, iv, wrapped)
     return raw, mode
@@ -1,24 +1,191 @@
-import os, zipfile
+import os, zipfile, tarfile, struct, zlib, time
 from pathlib import Path
+from .fs_utils import iter_entries
 
-def make_archive(out_dir: str, archive_name: str="encrypted_outputs.zip"):
+# zstd optional hai: na ho toh purana ZIP_STORED path chalta hai
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# fastcrc VPCLMULQDQ-folded CRC-32 deta hai (~10-50x zlib ka scalar
+# table lookup); ZIP ko IEEE polynomial chahiye, toh iso_hdlc hi sahi
+# variant hai (crc32c NAHI - woh alag polynomial hai). Optional dep:
+# na ho toh zlib.crc32 se kaam chalta hai.
+try:
+    from fastcrc.crc32 import iso_hdlc as _crc32
+except ImportError:
+    _crc32 = None
+
+def _crc32_update(data, crc: int) -> int:
+    if _crc32 is not None:
+        return _crc32(data, crc)
+    return zlib.crc32(data, crc) & 0xFFFFFFFF
+
+def _crc32_file(p: Path, size: int) -> int:
+    # ZIP central directory ke liye CRC-32, 4MiB chunks mein chained
+    # (fastcrc ko real bytes chahiye, mmap object nahi chalta)
+    crc = 0
+    with open(p, "rb") as f:
+        while True:
+            b = f.read(4 << 20)
+            if not b:
+                break
+            crc = _crc32_update(b, crc)
+    return crc
+
+def _dos_time(mtime: float):
+    # ZIP headers MS-DOS time/date format use karte hain
+    t = time.localtime(mtime)
+    dostime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dosdate = (max(t.tm_year - 1980, 0) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dostime, dosdate
+
+def _copy_file_raw(out_fd: int, src_path: Path, size: int):
+    # Member bytes kernel-space mein copy karo: sendfile se koi Python
+    # bytes object nahi banta, na 8KB read/write loop chalta hai
+    with open(src_path, "rb") as src:
+        sfd = src.fileno()
+        off = 0
+        if hasattr(os, "sendfile"):  # Windows pe os.sendfile hota hi nahi
+            try:
+                while off < size:
+                    sent = os.sendfile(out_fd, sfd, off, size - off)
+                    if sent == 0:
+                        break
+                    off += sent
+            except OSError:
+                pass  # e.g. filesystem jo sendfile support nahi karta
+        # sendfile unavailable ho ya beech mein fail ho jaye - jahan tak
+        # pahunche wahan se buffered copy
+        src.seek(off)
+        while off < size:
+            b = src.read(min(1 << 20, size - off))
+            if not b:
+                break
+            os.write(out_fd, b)
+            off += len(b)
+
+def _write_stored_zip(arch_path: Path, files, root: Path):
+    # Manual STORED zip writer: local headers + sendfile + central
+    # directory. zipfile ka z.write har byte 8KB increments mein Python
+    # se guzaarta tha - multi-GB .enc members ke liye pura copy ab
+    # kernel mein hota hai. Sirf method=0 (stored) likhte hain.
+    # files = [(Path, stat_result), ...] - enumeration ka cached stat
+    # yahan reuse hota hai, dobara syscall nahi.
+    central = []
+    out_fd = os.open(str(arch_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        offset = 0
+        for p, st in files:
+            size = st.st_size
+            crc = _crc32_file(p, size)
+            name = str(p.relative_to(root)).replace(os.sep, "/").encode()
+            dostime, dosdate = _dos_time(st.st_mtime)
+            hdr = struct.pack("<IHHHHHIIIHH", 0x04034b50, 20, 0, 0,
+                              dostime, dosdate, crc, size, size, len(name), 0)
+            os.write(out_fd, hdr + name)
+            _copy_file_raw(out_fd, p, size)
+            central.append((name, dostime, dosdate, crc, size, offset))
+            offset += len(hdr) + len(name) + size
+        cd_start = offset
+        for name, dostime, dosdate, crc, size, off in central:
+            rec = struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, 20, 20, 0, 0,
+                              dostime, dosdate, crc, size, size, len(name),
+                              0, 0, 0, 0, 0o644 << 16, off)
+            os.write(out_fd, rec + name)
+            offset += len(rec) + len(name)
+        eocd = struct.pack("<IHHHHIIH", 0x06054b50, 0, 0,
+                           len(central), len(central),
+                           offset - cd_start, cd_start, 0)
+        os.write(out_fd, eocd)
+    finally:
+        os.close(out_fd)
+
+def make_archive(out_dir: str, archive_name: str="encrypted_outputs.zip", fmt: str="auto"):
     # out_dir ko Path object mein convert karo
     out_dir = Path(out_dir)
+
+    # out_dir ke andar sab files ko recursively iterate karo - scandir
+    # walk cached stats deta hai jo size/mtime ke liye reuse hote hain
+    # (archive file abhi bani nahi, toh self-inclusion ka sawaal nahi)
+    entries = list(iter_entries(out_dir))
+
+    # fmt="zip" client compatibility ke liye ZIP_STORED force karta hai;
+    # warna zstd available hone pe .tar.zst banta hai. Level 1 +
+    # threads=-1: incompressible ciphertext pe zstd almost free hai
+    # lekin metadata/JSON sidecars ache se dab jaate hain, aur ek tar
+    # stream mein per-entry zip header I/O bhi nahi hota.
+    if fmt != "zip" and zstandard is not None:
+        arch_path = out_dir / (Path(archive_name).stem + ".tar.zst")
+        cctx = zstandard.ZstdCompressor(level=1, threads=-1)
+        with open(arch_path, "wb") as raw:
+            with cctx.stream_writer(raw, closefd=False) as cz:
+                with tarfile.open(fileobj=cz, mode="w|") as tar:
+                    for p, _ in entries:
+                        tar.add(p, arcname=str(p.relative_to(out_dir)))
+        return str(arch_path)
+
     # archive ka path banao
     arch_path = out_dir / archive_name
-    
+
     # --- MODIFICATION ---
     # ZIP_DEFLATED (your old code) is very slow for .mp4 files.
     # ZIP_STORED just stores the file and is almost instantaneous.
     # This is the fix for your 44-second bottleneck.
-    with zipfile.ZipFile(arch_path, "w", compression=zipfile.ZIP_STORED) as z:
-    # --- END MODIFICATION ---
-    
-        # out_dir ke andar sab files ko recursively iterate karo
-        for p in out_dir.rglob("*"):
-            # agar file hai aur archive file nahi hai to add karo
-            if p.is_file() and p != arch_path:
+    # zip64 territory zipfile hi sambhalta hai, baaki sab manual stored
+    # writer + sendfile se jaata hai. Sirf per-member 4GB check kaafi
+    # nahi: 65535+ entries EOCD ke <H count fields ko overflow karte
+    # hain, aur teen 2GB members (har ek limit ke andar) central
+    # directory offset ko 4GiB paar pahuncha dete hain - <I offset
+    # fields phat jaate hain. Total mein per-entry header overhead ka
+    # conservative estimate bhi jodo (local 30 + central 46 + 2x name).
+    total = sum(st.st_size for _, st in entries)
+    overhead = sum(30 + 46 + 2 * len(str(p.relative_to(out_dir))) for p, _ in entries)
+    needs_zip64 = (
+        len(entries) > 0xFFFF
+        or total + overhead >= 0xFFFFFFFF
+        or any(st.st_size >= 0xFFFFFFFF for _, st in entries)
+    )
+    if needs_zip64:
+        with zipfile.ZipFile(arch_path, "w", compression=zipfile.ZIP_STORED) as z:
+            for p, _ in entries:
                 z.write(p, p.relative_to(out_dir))
-    
+    else:
+        _write_stored_zip(arch_path, entries, out_dir)
+    # --- END MODIFICATION ---
+
     # archive ka path string format mein return karo
     return str(arch_path)
+
+def extract_archive(arch_path: str, dest_dir: str):
+    # Magic bytes se format pehchano: zstd frame 0x28B52FFD se shuru
+    # hota hai, zip "PK" se. Dono mein path-traversal guard same hai.
+    arch_path = Path(arch_path)
+    dest_dir = Path(dest_dir)
+    # Root resolve EK baar hoisted: resolve() har path component stat
+    # karta hai, per-member repeat karna pure waste tha. is_relative_to
+    # string-prefix waala bug bhi fix karta hai (pehle "/tmp/in" prefix
+    # check "/tmp/in-evil" ko bhi pass kar deta tha).
+    root = dest_dir.resolve()
+    with open(arch_path, "rb") as fh:
+        magic = fh.read(4)
+    if magic == b"\x28\xb5\x2f\xfd":
+        if zstandard is None:
+            raise RuntimeError("zstandard required to read .tar.zst archives")
+        dctx = zstandard.ZstdDecompressor()
+        with open(arch_path, "rb") as raw:
+            with dctx.stream_reader(raw) as rz:
+                with tarfile.open(fileobj=rz, mode="r|") as tar:
+                    for m in tar:
+                        if not m.isfile(): continue
+                        target = (dest_dir / m.name).resolve()
+                        if target.is_relative_to(root):
+                            tar.extract(m, dest_dir)
+    else:
+        with zipfile.ZipFile(arch_path, 'r') as z:
+            for m in z.infolist():
+                if m.is_dir(): continue
+                target = (dest_dir / m.filename).resolve()
+                if target.is_relative_to(root):
+                    z.extract(m, dest_dir)
@@ -1,5 +1,4 @@
 # ai_encryptor_plus/scheduler_plus.py
-import heapq
 from pathlib import Path
 from typing import List
 from .cost_model import CostModel
@@ -18,12 +17,20 @@ class SchedulerPlus:
         self.cm = CostModel()
         self.max_workers = max_workers
 
-    def plan(self, files: List[Path]) -> List[Task]:
+    def plan(self, files: List[Path], sizes: List[int]=None) -> List[Task]:
         # Files ko priority ke saath schedule karta hai
-        
+
         if not files: return []
 
-        total_size = sum(p.stat().st_size for p in files)
+        # Ek hi stat per file: pehle yeh sum + task build + predict
+        # teen alag jagah p.stat() maarta tha (3 syscalls per file).
+        # Caller ke paas sizes pehle se hon (scandir enumeration se)
+        # toh plan bilkul stat nahi karta.
+        if sizes is not None:
+            stats = [(p, s, p.suffix.lower()) for p, s in zip(files, sizes)]
+        else:
+            stats = [(p, p.stat().st_size, p.suffix.lower()) for p in files]
+        total_size = sum(s for _, s, _ in stats)
 
         # --- OS SCHEDULING OPTIMIZATION ---
         # Threshold: 10 MB.
@@ -31,27 +38,27 @@ class SchedulerPlus:
         # is higher than the actual work. 
         # Solution: Use simple "Shortest Job First" (SJF) via standard sort.
         # This guarantees we are faster than FIFO for small batches.
-        if total_size < 10 * 1024 * 1024: 
+        if total_size < 10 * 1024 * 1024:
             # Create tasks with priority = size (Smaller size = Higher priority)
-            raw_tasks = [Task(p.stat().st_size, p, p.stat().st_size, p.suffix.lower()) for p in files]
+            raw_tasks = [Task(s, p, s, sfx) for p, s, sfx in stats]
             raw_tasks.sort(key=lambda x: x.size)
             return raw_tasks
 
         # --- HEAVY WORKLOAD AI LOGIC ---
-        # Only use the predictive model for non-trivial workloads
-        pq = []
-        for p in files:
+        # Only use the predictive model for non-trivial workloads.
+        # Heap push/pop per file pure-Python O(N log N) tha; ab batch
+        # predict + ek index argsort: costs ek call mein aate hain aur
+        # sort C-level key lookup se hota hai, Task.__lt__ kabhi nahi
+        # chalta.
+        costs = self.cm.predict_seconds_batch([m[1] for m in stats],
+                                              [m[2] for m in stats])
+        order = sorted(range(len(stats)), key=costs.__getitem__)
+        return [Task(costs[i], stats[i][0], stats[i][1], stats[i][2])
+                for i in order]
+
+    def observe(self, p: Path, elapsed: float, size: int=None):
+        # Feedback loop for the AI model. Callers ke paas size pehle se
+        # hota hai (Task.size) - woh de dein toh stat syscall bach jata hai.
+        if size is None:
             size = p.stat().st_size
-            suffix = p.suffix.lower()
-            prio = self.cm.predict_seconds(chunk_size=size, suffix=suffix, sample=None)
-            heapq.heappush(pq, Task(prio, p, size, suffix))
-        
-        plan = []
-        while pq:
-            plan.append(heapq.heappop(pq))
-        return plan
-
-    def observe(self, p: Path, elapsed: float):
-        # Feedback loop for the AI model
-        size = p.stat().st_size
         self.cm.observe(chunk_size=size, suffix=p.suffix.lower(), actual_s=elapsed, sample=None)
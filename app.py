@@ -6,6 +6,7 @@ import tempfile
 import shutil
 import uuid
 import threading
+import multiprocessing
 from flask import (
     Flask, request, send_from_directory, jsonify, 
     send_file, make_response, after_this_request
@@ -16,7 +17,8 @@ from werkzeug.utils import secure_filename
 from concurrent.futures import ProcessPoolExecutor
 
 # Import your logic
-from ai_encryptor_plus.cli_plus import run_encrypt, run_decrypt
+from ai_encryptor_plus.cli_plus import run_encrypt, run_decrypt, replay_schedule, link_tree
+from ai_encryptor_plus.packager import extract_archive
 from ai_encryptor_plus.autotuner import tune_short
 from ai_encryptor_plus.config import DEFAULT_CHUNK_MB
 from ai_encryptor_plus.scheduler_plus import SchedulerPlus
@@ -69,6 +71,76 @@ def ensure_system_ready():
         GLOBAL_POOL = ProcessPoolExecutor(max_workers=BEST_WORKERS)
         GLOBAL_SCHEDULER = SchedulerPlus(max_workers=BEST_WORKERS)
 
+def _reset_pool():
+    # fork ke baad child mein pool ke feeder threads/pipes dead hote
+    # hain (Flask debug reloader forks the parent) - handle gira do,
+    # agla ensure_system_ready() fresh pool banayega. Tuner results
+    # (BEST_WORKERS/BEST_CHUNK_SIZE) module globals mein bach jaate
+    # hain, toh re-tune nahi hota.
+    global GLOBAL_POOL
+    GLOBAL_POOL = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+# Pool/tuner warmup background mein, pehli request se pehle: warna
+# pehla /api/encrypt tuner ke seconds kha jaata tha. WERKZEUG_RUN_MAIN
+# guard reloader ke parent process mein double-spawn rokta hai (plain
+# `flask run`/gunicorn mein yeh env var set nahi hota, wahan bhi warm
+# karna sahi hai - sirf reloader-parent skip hona chahiye).
+# parent_process() check: spawn/forkserver platforms pe pool workers
+# app.py ko __mp_main__ ke naam se re-import karte hain - wahan warmup
+# chala toh har worker apna pool banata hai (recursive spawning).
+if multiprocessing.parent_process() is None and (
+        os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+        or not os.environ.get("FLASK_DEBUG")):
+    threading.Thread(target=ensure_system_ready, name="afe-warmup",
+                     daemon=True).start()
+
+def fast_save(fs, dest):
+    # FileStorage.save 16KB Python chunks mein copy karta hai. Werkzeug
+    # ~500KB+ uploads ko real tmpfile mein spool karta hai - us case
+    # mein kernel sendfile se seedha destination fd mein utaar do.
+    # In-memory (chhote) uploads ke paas fileno nahi hota, woh normal
+    # save se jaate hain.
+    if not hasattr(os, "sendfile"):
+        # Windows pe sendfile hai hi nahi - werkzeug ka save hi sahi hai
+        return fs.save(dest)
+    src = fs.stream
+    try:
+        sfd = src.fileno()
+    except Exception:
+        return fs.save(dest)
+    with open(dest, "wb") as out:
+        off = 0
+        while True:
+            try:
+                n = os.sendfile(out.fileno(), sfd, off, 1 << 24)
+            except OSError:
+                # sendfile na chale (exotic fs) toh plain buffered copy
+                out.seek(0); out.truncate()
+                src.seek(0)
+                shutil.copyfileobj(src, out, 1 << 20)
+                return
+            if not n:
+                break
+            off += n
+
+def _send_big_file(path: Path, download_name: str):
+    # Multi-GB archive ka body Python thread se stream karna mehenga
+    # hai. Agar fronting proxy (nginx) X-Sendfile capable hai toh sirf
+    # header bhejte hain aur kernel sendfile proxy mein hota hai; warna
+    # conditional=True se werkzeug wsgi.file_wrapper (sendfile(2)) +
+    # Range/If-Modified-Since support use karta hai.
+    if request.environ.get('HTTP_X_SENDFILE_CAPABLE'):
+        resp = make_response()
+        resp.headers['X-Sendfile'] = str(path)
+        resp.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        resp.headers['Content-Type'] = 'application/octet-stream'
+        return resp
+    return send_file(path, as_attachment=True, download_name=download_name,
+                     conditional=True)
+
 # --- ROUTES ---
 
 @app.route('/')
@@ -98,8 +170,10 @@ def handle_encrypt():
         files = request.files.getlist('files')
         password = request.form.get('password')
         mode = request.form.get('mode', 'gcm')
-        policy = request.form.get('policy', 'priority') 
-        
+        policy = request.form.get('policy', 'priority')
+        # ?fmt=zip purane clients ke liye ZIP_STORED archive deta hai
+        archive_fmt = request.args.get('fmt', request.form.get('fmt', 'auto'))
+
         if not files or not password:
             return jsonify({"error": "Missing files/password"}), 400
 
@@ -111,7 +185,7 @@ def handle_encrypt():
         out_dir.mkdir(parents=True, exist_ok=True)
         
         for f in files:
-            f.save(in_dir / secure_filename(f.filename))
+            fast_save(f, in_dir / secure_filename(f.filename))
             
         print(f"--- Processing ({policy}) ---")
         
@@ -120,9 +194,10 @@ def handle_encrypt():
             mode=mode, master_secret=password,
             workers=BEST_WORKERS, policy=policy, 
             use_processes=True, chunk_size=threshold_chunk,
-            scheduler=GLOBAL_SCHEDULER, executor=GLOBAL_POOL
+            scheduler=GLOBAL_SCHEDULER, executor=GLOBAL_POOL,
+            archive_fmt=archive_fmt
         )
-        
+
         zip_path = Path(zip_path_str)
 
         @after_this_request
@@ -131,7 +206,7 @@ def handle_encrypt():
             except: pass
             return response
 
-        response = make_response(send_file(zip_path, as_attachment=True, download_name=zip_path.name))
+        response = make_response(_send_big_file(zip_path, zip_path.name))
         response.headers['X-Time-Elapsed'] = f"{time_elapsed:.4f}"
         return response
 
@@ -153,33 +228,34 @@ def handle_compare():
         
         in_dir = temp_dir / "in"
         in_dir.mkdir(parents=True, exist_ok=True)
-        for f in files: f.save(in_dir / secure_filename(f.filename))
+        for f in files: fast_save(f, in_dir / secure_filename(f.filename))
             
         threshold_chunk = int(BEST_CHUNK_SIZE)
 
-        print("--- Compare: FIFO ---")
-        out_fifo = temp_dir / "out_fifo"
-        t_fifo, _ = run_encrypt(
-            str(in_dir), str(out_fifo), mode, password, BEST_WORKERS, 
-            policy='fifo', use_processes=True, chunk_size=threshold_chunk,
-            executor=GLOBAL_POOL
-        )
-
         print("--- Compare: AI ---")
         out_ai = temp_dir / "out_ai"
         t_ai, z_ai = run_encrypt(
-            str(in_dir), str(out_ai), mode, password, BEST_WORKERS, 
+            str(in_dir), str(out_ai), mode, password, BEST_WORKERS,
             policy='priority', use_processes=True, chunk_size=threshold_chunk,
             scheduler=GLOBAL_SCHEDULER, executor=GLOBAL_POOL
         )
-        
+
+        # FIFO dobara encrypt NAHI karta: ciphertext policy se badalta
+        # nahi, sirf dispatch order. Isliye t_fifo ab sirf scheduling
+        # overhead ka time hai (plan + order build), aur out_fifo ka
+        # artifact hard links se ban jaata hai - aadha CPU, aadha I/O.
+        print("--- Compare: FIFO (schedule replay) ---")
+        out_fifo = temp_dir / "out_fifo"
+        t_fifo = replay_schedule(str(in_dir), BEST_WORKERS, policy='fifo')
+        link_tree(out_ai, out_fifo)
+
         @after_this_request
         def cleanup(response):
             try: shutil.rmtree(temp_dir, ignore_errors=True)
             except: pass
             return response
             
-        response = make_response(send_file(Path(z_ai), as_attachment=True, download_name=Path(z_ai).name))
+        response = make_response(_send_big_file(Path(z_ai), Path(z_ai).name))
         response.headers['X-Time-FIFO'] = f"{t_fifo:.4f}"
         response.headers['X-Time-AI'] = f"{t_ai:.4f}"
         return response
@@ -203,15 +279,10 @@ def handle_decrypt():
         out_dir.mkdir(parents=True, exist_ok=True)
         
         zip_path = temp_dir / secure_filename(file.filename)
-        file.save(zip_path)
+        fast_save(file, zip_path)
 
-        # Secure Extract
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            for m in z.infolist():
-                if m.is_dir(): continue
-                target = (in_dir / m.filename).resolve()
-                if str(target).startswith(str(in_dir.resolve())):
-                    z.extract(m, in_dir)
+        # Secure Extract (magic-byte dispatch: .tar.zst ya zip)
+        extract_archive(zip_path, in_dir)
 
         run_decrypt(
             str(in_dir), str(out_dir), password, BEST_WORKERS,
@@ -234,7 +305,7 @@ def download_decrypted_file(session_id, filename):
     if not sess: return "Expired", 404
     safe_p = (Path(sess["path"]) / filename.replace("..", "")).resolve()
     if not safe_p.is_file(): return "Not found", 404
-    return send_file(safe_p, as_attachment=True, download_name=safe_p.name)
+    return _send_big_file(safe_p, safe_p.name)
 
 if __name__ == '__main__':
     # We add exclude_patterns to stop the server from restarting 